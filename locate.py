@@ -1,3 +1,4 @@
+import json
 import os
 import pathlib
 from typing import List
@@ -7,40 +8,216 @@ import pandas as pd
 from config import project_root
 from glm import ChatGLM, ModelType
 from locate_with_questions import display_commit_list
-from summarize import summarize_spring_boot_folder
+from summarize import collect_java_files, summarize_changed_files_to_store, summarize_files_to_store
 from utils.file_format_detect import detect_response_format
-from utils.files import concat_code_files, read_and_replace_prompt
-from utils.git import checkout_to_parent_commit
+from utils.files import concat_code_files, get_all_commits, read_and_replace_prompt
+from utils.git import checkout_to_parent_commit, get_head_commit, ls_tree_blobs
 from utils.rag.content_provider import RAGContentProvider
+from utils.summary_store import SummaryStore, read_summaries
 from utils.rag.rag_system import RAGSystem
 from utils.tool.file_viewer import ToolParser, get_file_content
 
 
-def save_summary_xlsx(spring_boot_folder, output_path, content_column, source_column, max_workers=50):
+# 记录最近一次生成摘要时检出的提交及摘要文件，供下一个提交做增量摘要
+SUMMARY_STATE_PATH = "summary/latest.json"
+
+
+def load_summary_state():
+    """
+    读取最近一次摘要的(提交哈希, 摘要文件路径, RAG索引路径)，不存在或摘要文件已被删除时返回None。
+    索引路径未记录或索引文件已被删除时为None。
+    """
+    if not os.path.exists(SUMMARY_STATE_PATH):
+        return None
+    with open(SUMMARY_STATE_PATH, "r", encoding="utf-8") as f:
+        state = json.load(f)
+    if not os.path.exists(state["path"]):
+        return None
+    index_path = state.get("index")
+    if index_path is not None and not os.path.exists(index_path):
+        index_path = None
+    return state["commit"], state["path"], index_path
+
+
+def save_summary_state(commit, summary_path, index_path=None):
+    os.makedirs(os.path.dirname(SUMMARY_STATE_PATH), exist_ok=True)
+    with open(SUMMARY_STATE_PATH, "w", encoding="utf-8") as f:
+        json.dump({"commit": commit, "path": summary_path, "index": index_path}, f)
+
+
+def read_summary_items(summary_path, content_column, source_column):
+    """
+    读取摘要文件中的(文件路径, 摘要)，支持SQLite摘要库(.db)和Excel(.xlsx)。
+    """
+    if summary_path.endswith(".xlsx"):
+        df = pd.read_excel(summary_path)
+        return zip(df[source_column], df[content_column])
+    return read_summaries(summary_path)
+
+
+def write_summary_store(spring_boot_folder, store, content_column, source_column, max_workers=50,
+                        base_summary=None):
+    """
+    生成摘要并逐条写入store。
+    base_summary为(基准提交, 基准摘要文件路径)时，只重新总结基准提交到当前HEAD之间变化的文件，其余摘要直接沿用。
+    """
+    if base_summary is None:
+        summarize_files_to_store(collect_java_files(spring_boot_folder), store, max_workers=max_workers)
+    else:
+        base_commit, base_path = base_summary
+        print(f"Reusing summary of commit {base_commit} from {base_path}.")
+        previous = read_summary_items(base_path, content_column, source_column)
+        summarize_changed_files_to_store(spring_boot_folder, store, previous, base_commit, max_workers=max_workers)
+
+
+def save_summary(spring_boot_folder, output_path, content_column, source_column, max_workers=50,
+                 base_summary=None):
+    """
+    生成摘要并保存到output_path，按扩展名选择格式：.xlsx为Excel，其余为SQLite摘要库。
+    摘要生成过程中逐条写入output_path旁的检查点文件，中断后重新运行会跳过已完成的文件。
+    """
+    if output_path.endswith(".xlsx"):
+        save_summary_xlsx(spring_boot_folder, output_path, content_column, source_column, max_workers, base_summary)
+        return
+
+    print("Saving Summary to SQLite...")
+    checkpoint_path = output_path + ".checkpoint.db"
+    if os.path.exists(checkpoint_path):
+        print(f"Resuming from checkpoint {checkpoint_path}.")
+    store = SummaryStore(checkpoint_path)
+    write_summary_store(spring_boot_folder, store, content_column, source_column, max_workers, base_summary)
+    store.close()
+    # 全部完成后再改名，output_path存在即表示摘要完整
+    os.replace(checkpoint_path, output_path)
+    print(f"Summary SQLite Saved to {output_path}.")
+
+
+def save_summary_xlsx(spring_boot_folder, output_path, content_column, source_column, max_workers=50,
+                      base_summary=None):
+    """
+    base_summary为(基准提交, 基准摘要文件路径)时，只重新总结基准提交到当前HEAD之间变化的文件，其余摘要直接沿用。
+    摘要生成过程中逐条写入output_path旁的检查点文件，中断后重新运行会跳过已完成的文件，导出Excel后删除检查点。
+    """
     print("Saving Summary to Excel...")
-    result = summarize_spring_boot_folder(spring_boot_folder, max_workers=max_workers)
-    df = pd.DataFrame(list(result.items()), columns=[source_column, content_column])
+    checkpoint_path = output_path + ".checkpoint.db"
+    if os.path.exists(checkpoint_path):
+        print(f"Resuming from checkpoint {checkpoint_path}.")
+    store = SummaryStore(checkpoint_path)
+    write_summary_store(spring_boot_folder, store, content_column, source_column, max_workers, base_summary)
+    df = pd.DataFrame(store.items(), columns=[source_column, content_column])
     df.to_excel(output_path, index=False)
+    store.close()
+    os.remove(checkpoint_path)
     print(f"Summary Excel Saved to {output_path}.")
 
 
-def create_index(summary_xlsx_path, content_column, source_column, output_path):
-    print("Creating RAG Index...")
-
+def create_index(summary_path, content_column, source_column, output_path, base_index_path=None):
+    """
+    base_index_path为上一个提交的索引时，在其基础上只为变化的摘要计算向量，否则重新构建整个索引。
+    """
     content_provider = RAGContentProvider(".")
-    content_provider.add_excel_file(summary_xlsx_path,content_column,source_column)
-    rag_system = RAGSystem.from_content_provider(content_provider, None)
+    if summary_path.endswith(".xlsx"):
+        content_provider.add_excel_file(summary_path, content_column, source_column)
+    else:
+        content_provider.add_sqlite_file(summary_path)
+
+    if base_index_path is not None:
+        print(f"Updating RAG Index from {base_index_path}...")
+        rag_system = RAGSystem.load_index(base_index_path, None)
+        added, removed = rag_system.update_from_content_provider(content_provider)
+        print(f"{added} documents added, {removed} documents removed.")
+    else:
+        print("Creating RAG Index...")
+        rag_system = RAGSystem.from_content_provider(content_provider, None)
     print(f"Saving RAG Index...")
     rag_system.save_index(output_path)
     print(f"RAG Index Saved to {output_path}.")
 
 
-def rag_query(rag_index_filepath, rag_prompt_filepath, variables):
+def update_shared_index(summary_path, content_column, source_column, index_path, blobs):
+    """
+    把摘要追加到多个提交共用的索引中。blobs为{摘要中的文件路径: blob哈希}，
+    每条摘要按(文件路径, blob哈希)存储，已经存在的版本不会重复向量化。
+    """
+    content_provider = RAGContentProvider(".")
+    if summary_path.endswith(".xlsx"):
+        content_provider.add_excel_file(summary_path, content_column, source_column, blobs=blobs)
+    else:
+        content_provider.add_sqlite_file(summary_path, blobs=blobs)
+
+    if os.path.exists(index_path):
+        rag_system = RAGSystem.load_index(index_path, None)
+        added = rag_system.add_missing_versions(content_provider)
+        print(f"{added} documents added to shared RAG Index.")
+        if added == 0:
+            return
+    else:
+        print("Creating shared RAG Index...")
+        rag_system = RAGSystem.from_content_provider(content_provider, None)
+    rag_system.save_index(index_path)
+    print(f"RAG Index Saved to {index_path}.")
+
+
+def rag_query(rag_index_filepath, rag_prompt_filepath, variables, versions=None):
+    """
+    versions为{(文件路径, blob哈希)}时只检索这些版本的文档，用于在共享索引中限定到某个提交。
+    """
     rag_prompt = read_and_replace_prompt(rag_prompt_filepath, variables)
     rag_system = RAGSystem.load_index(rag_index_filepath, rag_prompt)
+    rag_system.set_visible_versions(versions)
     return rag_system.get_assembled_prompt(rag_prompt, None)
 
 
+def rag_query_many(rag_index_filepath, rag_prompt_filepath, queries):
+    """
+    用同一个索引为多个查询组装提示词，queries为[(variables, versions)]，返回[(prompt, context)]。
+    versions与rag_query相同但只对自己的查询生效，不同提交的查询可以一起调用：所有查询一起向量化，同一提交的查询合并为一次检索。
+    """
+    rag_prompts = [read_and_replace_prompt(rag_prompt_filepath, variables) for variables, _ in queries]
+    # 模板只有问题占位符，组装时每个查询本身就是完整的提示词，其中的{{context}}再被替换为检索结果
+    rag_system = RAGSystem.load_index(rag_index_filepath, "{{question}}")
+    return rag_system.get_assembled_prompts([(rag_prompt, None) for rag_prompt in rag_prompts],
+                                            versions=[versions for _, versions in queries])
+
+
+def read_commit_blobs(commit="HEAD"):
+    """
+    返回提交中每个文件的{绝对路径: blob哈希}，路径与共享索引中文档的来源一致；无法读取时返回None。
+    """
+    success, blobs = ls_tree_blobs(project_root, commit)
+    if not success:
+        print(blobs)
+        return None
+    return {os.path.join(project_root, *path.split("/")): blob for path, blob in blobs.items()}
+
+
+def rag_query_dataset(commits=None, prompt_path="prompt/locate.md"):
+    """
+    为数据集中的提交组装定位提示词，commits默认为get_all_commits()的全部提交，返回{commit hash: (prompt, context)}。
+    每个提交只检索其父提交中的文件版本，同一数据集的提交在共享索引上一起向量化和检索。
+    共享索引需要已经由locate建立并包含这些版本，索引不存在或父提交文件列表无法读取的提交会被跳过。
+    """
+    if commits is None:
+        commits = get_all_commits()
+    queries_by_index = {}
+    for commit_type, commit_msg, commit_hash, filename in commits:
+        rag_index_path = f"rag_index/{os.path.splitext(filename)[0]}/shared.index"
+        blobs = read_commit_blobs(f"{commit_hash}^") if os.path.exists(rag_index_path) else None
+        if blobs is None:
+            print(f"Skipping {commit_hash}: shared RAG Index or parent commit files not available.")
+            continue
+        variables = {"commit_type": commit_type, "commit_msg": commit_msg, "commit_hash": commit_hash}
+        queries_by_index.setdefault(rag_index_path, []).append((commit_hash, variables, set(blobs.items())))
+
+    results = {}
+    for rag_index_path, queries in queries_by_index.items():
+        print(f"RAG querying {len(queries)} commits with {rag_index_path}...")
+        prompts = rag_query_many(rag_index_path, prompt_path,
+                                 [(variables, versions) for _, variables, versions in queries])
+        results.update(zip([commit_hash for commit_hash, _, _ in queries], prompts))
+    return results
+
+
 def chating(prompt, model):
     messages = [{"role": "user", "content": prompt}]
 
@@ -95,20 +272,40 @@ def locate(commit_type, commit_msg, commit_hash, commit_data_type):
     summary_content_column = "摘要"
     summary_source_column = "文件路径"
 
-    summary_path = f"summary/{commit_data_type}/{commit_hash}.xlsx"
+    summary_path = f"summary/{commit_data_type}/{commit_hash}.db"
+    legacy_summary_path = f"summary/{commit_data_type}/{commit_hash}.xlsx"
+    if not os.path.exists(summary_path) and os.path.exists(legacy_summary_path):
+        summary_path = legacy_summary_path
     os.makedirs(os.path.dirname(summary_path), exist_ok=True)
 
+    head_commit = get_head_commit(project_root)
+    state = load_summary_state() if head_commit else None
     if os.path.exists(summary_path):
-        print("Summary Excel already exists. Skipping summary generation.")
+        print("Summary already exists. Skipping summary generation.")
     else:
-        save_summary_xlsx(project_root, summary_path, summary_content_column, summary_source_column, max_workers=50)
+        base_summary = state[:2] if state else None
+        save_summary(project_root, summary_path, summary_content_column, summary_source_column, max_workers=50,
+                     base_summary=base_summary)
 
-    rag_index_path = f"rag_index/{commit_data_type}/{commit_hash}.index"
-    os.makedirs(os.path.dirname(rag_index_path), exist_ok=True)
-    if os.path.exists(rag_index_path):
-        print("RAG Index already exists. Skipping index creation.")
+    # 能取得当前提交的文件列表时，所有提交共用一个按(文件路径, blob哈希)存储的索引，查询时只看当前提交的版本
+    blobs = read_commit_blobs() if head_commit else None
+    versions = None
+    if blobs is not None:
+        versions = set(blobs.items())
+        rag_index_path = f"rag_index/{commit_data_type}/shared.index"
+        os.makedirs(os.path.dirname(rag_index_path), exist_ok=True)
+        update_shared_index(summary_path, summary_content_column, summary_source_column, rag_index_path, blobs)
     else:
-        create_index(summary_path, summary_content_column, summary_source_column, rag_index_path)
+        rag_index_path = f"rag_index/{commit_data_type}/{commit_hash}.index"
+        os.makedirs(os.path.dirname(rag_index_path), exist_ok=True)
+        if os.path.exists(rag_index_path):
+            print("RAG Index already exists. Skipping index creation.")
+        else:
+            base_index_path = state[2] if state else None
+            create_index(summary_path, summary_content_column, summary_source_column, rag_index_path,
+                         base_index_path)
+    if head_commit:
+        save_summary_state(head_commit, summary_path, rag_index_path)
 
     print("RAG querying...")
     prompt_path = "prompt/locate.md"
@@ -116,7 +313,7 @@ def locate(commit_type, commit_msg, commit_hash, commit_data_type):
         "commit_type": commit_type,
         "commit_msg": commit_msg, 
         "commit_hash": commit_hash,
-    })
+    }, versions)
     print("RAG query finished.")
     print("\n\n==========Locate Prompt==========")
     print(rag_result)
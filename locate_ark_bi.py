@@ -10,23 +10,9 @@ from datetime import datetime
 from volcenginesdkarkruntime import AsyncArk
 
 import config
-from utils.files import read_commit, read_and_replace_prompt, concat_code_files
+from utils.files import get_all_commits, read_and_replace_prompt, concat_code_files
 from utils.git import checkout_to_parent_commit
-
-
-def get_all_commits(data_folder="./data"):
-    """
-    commit = [(commit_type, commit_msg, commit_hash, filename)]
-    """
-    commits = []
-    for filename in os.listdir(data_folder):
-        file_path = os.path.join(data_folder, filename)
-        commit = read_commit(file_path)
-        for commit_tuple in commit:
-            commit_type, commit_msg, commit_hash = commit_tuple
-            new_commit = (commit_type, commit_msg, commit_hash, filename)
-            commits.append(new_commit)
-    return commits
+from utils.tokens import FULL_TEXT_TOKEN_BUDGET
 
 
 async def worker(
@@ -138,7 +124,8 @@ async def main(project_root=config.project_root):
             exit()
 
         code_repo = concat_code_files(
-            project_root, filter=lambda x: x.endswith(".java"), use_relative_path=True
+            project_root, filter=lambda x: x.endswith(".java"), use_relative_path=True,
+            token_budget=FULL_TEXT_TOKEN_BUDGET,
         )
 
         system_prompt = read_and_replace_prompt(
@@ -12,6 +12,7 @@ from config import project_root
 from locate_with_questions import display_commit_list
 from utils.files import concat_code_files, read_and_replace_prompt
 from utils.git import checkout_to_parent_commit
+from utils.tokens import FULL_TEXT_TOKEN_BUDGET
 
 
 if __name__ == "__main__":
@@ -38,7 +39,8 @@ if __name__ == "__main__":
         exit()
 
     code_repo = concat_code_files(
-        project_root, filter=lambda x: x.endswith(".java"), use_relative_path=True
+        project_root, filter=lambda x: x.endswith(".java"), use_relative_path=True,
+        token_budget=FULL_TEXT_TOKEN_BUDGET,
     )
 
     system_prompt = read_and_replace_prompt(
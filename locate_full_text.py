@@ -3,28 +3,31 @@ import os
 
 from config import project_root
 from glm import ChatGLM, ModelType
-from utils.files import concat_code_files, read_commit, read_prompt
+from utils.files import concat_code_files, read_commit, read_prompt, write_code_files, write_omitted_files
 from utils.git import checkout_to_parent_commit
+from utils.tokens import FULL_TEXT_TOKEN_BUDGET
 
 
-def concat_java_code_files(root_folder: str) -> str:
-    return concat_code_files(root_folder, filter=lambda x: x.endswith(".java"))
+def concat_java_code_files(root_folder: str, token_budget=FULL_TEXT_TOKEN_BUDGET) -> str:
+    return concat_code_files(root_folder, filter=lambda x: x.endswith(".java"), token_budget=token_budget)
 
 
-def generate_full_code_string_cached(root_folder: str, comment_hash: str) -> str:
-    """带缓存的完整代码处理"""
+def generate_full_code_string_cached(root_folder: str, comment_hash: str, token_budget=FULL_TEXT_TOKEN_BUDGET) -> str:
+    """带缓存的完整代码处理，超出token_budget的文件只在末尾列出文件名"""
     cache_dir = "cache/full_code"
     os.makedirs(cache_dir, exist_ok=True)
-    cache_file_path = os.path.join(cache_dir, f"{comment_hash}.txt")
-
-    if os.path.exists(cache_file_path):
-        with open(cache_file_path, "r", encoding="utf-8") as cache_file:
-            return cache_file.read()
-    else:
-        full_code = concat_java_code_files(root_folder)
-        with open(cache_file_path, "w", encoding="utf-8") as cache_file:
-            cache_file.write(full_code)
-        return full_code
+    cache_file_path = os.path.join(cache_dir, f"{comment_hash}-{token_budget}.txt")
+
+    if not os.path.exists(cache_file_path):
+        # 直接把代码写入缓存文件，不在内存中拼接字符串；写完后再替换，避免留下不完整的缓存
+        tmp_path = cache_file_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as cache_file:
+            omitted = write_code_files(cache_file, root_folder, filter=lambda x: x.endswith(".java"),
+                                       token_budget=token_budget)
+            write_omitted_files(cache_file, omitted, root_folder, token_budget=token_budget)
+        os.replace(tmp_path, cache_file_path)
+    with open(cache_file_path, "r", encoding="utf-8") as cache_file:
+        return cache_file.read()
 
 
 if __name__ == "__main__":
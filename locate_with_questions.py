@@ -8,6 +8,7 @@ from config import project_root
 from glm import ChatGLM, ModelType
 from utils.files import read_commit, concat_code_files, read_and_replace_prompt
 from utils.git import checkout_to_parent_commit
+from utils.tokens import FULL_TEXT_TOKEN_BUDGET
 from utils.tool.file_viewer import ToolParser, get_file_content
 
 
@@ -150,7 +151,8 @@ def locate_with_questions(
         exit()
 
     code_repo = concat_code_files(
-        sb_project_root, filter=lambda x: x.endswith(".java"), use_relative_path=True
+        sb_project_root, filter=lambda x: x.endswith(".java"), use_relative_path=True,
+        token_budget=FULL_TEXT_TOKEN_BUDGET,
     )
 
     prompt = (
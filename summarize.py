@@ -1,12 +1,24 @@
+import asyncio
+import contextlib
+import hashlib
 import os
 import re
-import concurrent.futures
+
+from javalang.tokenizer import LexerError
+
 from glm import ModelType, ChatGLM
+from utils.git import diff_name_status
+from utils.java_source import extract_methods, split_java_source
+from utils.summary_cache import SummaryCache
+from utils.summary_engine import GLMBackend, SummaryEngine
 
 
-import re
+# 方法提取方式的版本，提示词中列出的方法来自这里，提取结果变化时需要修改版本号，使旧的摘要缓存失效
+# 2：基于javalang词法分析提取完整签名（1为正则提取方法名）
+FUNCTION_EXTRACTOR_VERSION = "2"
 
-def extract_functions(file_content):
+
+def _extract_functions_regex(file_content):
     pattern = r"""
         (?:@\w+(?:\s*\([^)]*\))?\s*)*
         (?:public|private|protected)?
@@ -23,72 +35,328 @@ def extract_functions(file_content):
     return [match.group(1) for match in matches]
 
 
+def extract_function_signatures(file_content, fragment=False):
+    """
+    提取文件中声明的方法签名，基于javalang词法分析，结果按blob哈希缓存。
+    fragment为True时file_content是大文件的一个分段。词法分析失败时退回正则，只返回方法名。
+    """
+    try:
+        return [method.signature for method in extract_methods(file_content, fragment=fragment)]
+    except LexerError:
+        return _extract_functions_regex(file_content)
+
+
+def extract_functions(file_content):
+    """
+    提取文件中声明的方法名。
+    """
+    try:
+        return [method.name for method in extract_methods(file_content)]
+    except LexerError:
+        return _extract_functions_regex(file_content)
+
+
+# 摘要提示词模板，修改任意一段或FUNCTION_EXTRACTOR_VERSION都会改变PROMPT_TEMPLATE_ID，从而使旧的摘要缓存失效
+PROMPT_HEADER = "请用中文概括文件：{file_path}\n\n"
+PROMPT_OVERVIEW = "【文件整体概括】：请总结该文件的主要功能和作用。\n\n"
+PROMPT_FUNCTIONS = "【函数概括】：请分别概括下列函数的功能：\n{functions}\n"
+PROMPT_NO_FUNCTIONS = "该文件未检测到明显的函数定义，请直接概括文件主体内容，如果它是一个实体类，则需要具体地概括其中每一个字段的作用。\n"
+PROMPT_CONTENT = "\n文件内容如下：\n{file_content}"
+PROMPT_FUNCTION_ITEM = "- {function}"
+
+PROMPT_TEMPLATE_ID = hashlib.sha1(
+    "\0".join([FUNCTION_EXTRACTOR_VERSION, PROMPT_HEADER, PROMPT_OVERVIEW, PROMPT_FUNCTIONS, PROMPT_NO_FUNCTIONS,
+               PROMPT_CONTENT, PROMPT_FUNCTION_ITEM]).encode("utf-8")
+).hexdigest()
+
 
 def generate_prompt(file_path, file_content, rel_path=False, project_root=None):
     """
     生成摘要提示词，包括文件整体概述及函数功能描述。
     如果rel_path=True并且传入了project_root，则生成的prompt中包含的路径为相对路径。
     """
-    functions = extract_functions(file_content)
+    functions = extract_function_signatures(file_content)
     if (not rel_path) or (project_root is None):
-        prompt = f"请用中文概括文件：{file_path}\n\n"
+        prompt = PROMPT_HEADER.format(file_path=file_path)
     else:
         # 计算相对路径
         rel_path = os.path.relpath(file_path, project_root)
-        prompt = f"请用中文概括文件：{rel_path}\n\n"
-    prompt += "【文件整体概括】：请总结该文件的主要功能和作用。\n\n"
+        prompt = PROMPT_HEADER.format(file_path=rel_path)
+    prompt += PROMPT_OVERVIEW
     if functions:
-        prompt += "【函数概括】：请分别概括下列函数的功能：\n" + "\n".join(f"- {func}" for func in functions) + "\n"
+        prompt += PROMPT_FUNCTIONS.format(
+            functions="\n".join(PROMPT_FUNCTION_ITEM.format(function=func) for func in functions))
     else:
-        prompt += "该文件未检测到明显的函数定义，请直接概括文件主体内容，如果它是一个实体类，则需要具体地概括其中每一个字段的作用。\n"
-    prompt += "\n文件内容如下：\n" + file_content
+        prompt += PROMPT_NO_FUNCTIONS
+    prompt += PROMPT_CONTENT.format(file_content=file_content)
+    return prompt
+
+
+# 打包摘要提示词模板：把多个小文件放进同一个请求，要求模型按文件返回JSON
+PACKED_PROMPT_HEADER = (
+    "请用中文分别概括下列{count}个文件。\n"
+    "对每个文件：总结该文件的主要功能和作用；如果列出了函数，请分别概括这些函数的功能；"
+    "如果它是一个实体类，则需要具体地概括其中每一个字段的作用。\n\n"
+    "请严格按照JSON对象格式输出，键为文件路径（与下文给出的路径完全一致），值为该文件的摘要文本，不要输出任何其他内容。\n"
+)
+PACKED_PROMPT_FILE = "\n===== 文件：{file_path} =====\n{functions}文件内容如下：\n{file_content}\n"
+PACKED_PROMPT_FUNCTIONS = "函数：{functions}\n"
+
+PACKED_PROMPT_TEMPLATE_ID = hashlib.sha1(
+    "\0".join([FUNCTION_EXTRACTOR_VERSION, PACKED_PROMPT_HEADER, PACKED_PROMPT_FILE,
+               PACKED_PROMPT_FUNCTIONS]).encode("utf-8")
+).hexdigest()
+
+# 打包模式的默认参数（按token估算）：单个请求的预算，以及被视为“小文件”的上限
+DEFAULT_PACK_TOKEN_BUDGET = 6000
+DEFAULT_SMALL_FILE_TOKENS = 1500
+
+
+def generate_packed_prompt(files):
+    """
+    生成多文件打包摘要提示词。
+    files为(文件路径, 文件内容)列表，这里的文件路径也是模型返回JSON中的键。
+    """
+    prompt = PACKED_PROMPT_HEADER.format(count=len(files))
+    for file_path, file_content in files:
+        functions = extract_functions(file_content)
+        functions_line = PACKED_PROMPT_FUNCTIONS.format(functions=", ".join(functions)) if functions else ""
+        prompt += PACKED_PROMPT_FILE.format(file_path=file_path, functions=functions_line, file_content=file_content)
     return prompt
 
 
-def summarize_file(file_path, model):
+# 超大文件分段摘要(map-reduce)提示词模板
+CHUNK_PROMPT_HEADER = "下面是文件 {file_path} 的第 {index}/{total} 部分，请用中文概括这一部分的内容。\n"
+CHUNK_PROMPT_FUNCTIONS = "【函数概括】：请分别概括下列函数的功能：\n{functions}\n"
+CHUNK_PROMPT_NO_FUNCTIONS = "这一部分未检测到明显的函数定义，请概括其中的字段、常量或其他声明的作用。\n"
+CHUNK_PROMPT_CONTENT = "\n内容如下：\n{chunk}"
+MERGE_PROMPT_HEADER = "文件 {file_path} 较大，已被分为 {total} 个部分分别概括，各部分的摘要如下。\n"
+MERGE_PROMPT_PART = "\n【第 {index} 部分摘要】\n{summary}\n"
+MERGE_PROMPT_FOOTER = (
+    "\n请将以上摘要合并为该文件的完整中文摘要，包含：\n"
+    "【文件整体概括】：该文件的主要功能和作用。\n"
+    "【函数概括】：保留各部分中每个函数的功能概括。\n"
+)
+
+CHUNK_PROMPT_TEMPLATE_ID = hashlib.sha1(
+    "\0".join([FUNCTION_EXTRACTOR_VERSION, CHUNK_PROMPT_HEADER, CHUNK_PROMPT_FUNCTIONS, CHUNK_PROMPT_NO_FUNCTIONS,
+               CHUNK_PROMPT_CONTENT, MERGE_PROMPT_HEADER, MERGE_PROMPT_PART, MERGE_PROMPT_FOOTER]).encode("utf-8")
+).hexdigest()
+
+# 估算token数超过该值的文件走分段摘要，每段不超过DEFAULT_CHUNK_TOKENS
+DEFAULT_LARGE_FILE_TOKENS = 12000
+DEFAULT_CHUNK_TOKENS = 4000
+
+
+def generate_chunk_prompt(file_path, chunk, index, total):
     """
-    读取文件内容，生成摘要。
+    生成超大文件中一个分段的摘要提示词。
     """
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-    except Exception as e:
-        print(f"读取文件 {file_path} 失败：{e}")
-        return file_path, None
+    functions = extract_function_signatures(chunk, fragment=True)
+    prompt = CHUNK_PROMPT_HEADER.format(file_path=file_path, index=index, total=total)
+    if functions:
+        prompt += CHUNK_PROMPT_FUNCTIONS.format(
+            functions="\n".join(PROMPT_FUNCTION_ITEM.format(function=func) for func in functions))
+    else:
+        prompt += CHUNK_PROMPT_NO_FUNCTIONS
+    prompt += CHUNK_PROMPT_CONTENT.format(chunk=chunk)
+    return prompt
+
 
-    prompt = generate_prompt(file_path, content)
-    summary = model(prompt)
-    return file_path, summary
+def generate_merge_prompt(file_path, chunk_summaries):
+    """
+    生成把各分段摘要合并为文件摘要的提示词。
+    """
+    prompt = MERGE_PROMPT_HEADER.format(file_path=file_path, total=len(chunk_summaries))
+    for index, summary in enumerate(chunk_summaries):
+        prompt += MERGE_PROMPT_PART.format(index=index + 1, summary=summary)
+    prompt += MERGE_PROMPT_FOOTER
+    return prompt
 
 
-def summarize_spring_boot_folder(root_folder, max_workers=5):
+def build_engine(backend, max_in_flight=5, requests_per_minute=None, use_cache=True, print_log=False,
+                 pack_token_budget=None, small_file_tokens=DEFAULT_SMALL_FILE_TOKENS,
+                 large_file_tokens=DEFAULT_LARGE_FILE_TOKENS, chunk_tokens=DEFAULT_CHUNK_TOKENS, cache=None):
     """
-    递归遍历 root_folder 下所有 Java 文件，并发生成摘要。
+    使用本模块的摘要提示词创建摘要引擎。
+    use_cache为True时使用持久化的摘要缓存，只有内容发生变化的文件才会调用模型。
+    pack_token_budget不为None时开启打包模式，不超过small_file_tokens的小文件会按该预算合并到同一个请求中。
+    超过large_file_tokens的文件在方法边界切分为不超过chunk_tokens的分段，并发总结后再合并，None表示不分段。
+    cache为已有的SummaryCache实例时直接使用，此时忽略use_cache。
     """
-    # 初始化 ChatGLM 模型
-    model = ChatGLM(model_type=ModelType.GLM_4)
+    if cache is None and use_cache:
+        cache = SummaryCache()
+    return SummaryEngine(backend, generate_prompt, PROMPT_TEMPLATE_ID, max_in_flight=max_in_flight,
+                         requests_per_minute=requests_per_minute, cache=cache, print_log=print_log,
+                         packed_prompt_builder=generate_packed_prompt, packed_template_id=PACKED_PROMPT_TEMPLATE_ID,
+                         pack_token_budget=pack_token_budget, small_file_tokens=small_file_tokens,
+                         splitter=split_java_source, chunk_prompt_builder=generate_chunk_prompt,
+                         merge_prompt_builder=generate_merge_prompt, chunk_template_id=CHUNK_PROMPT_TEMPLATE_ID,
+                         large_file_tokens=large_file_tokens, chunk_tokens=chunk_tokens)
+
+
+@contextlib.contextmanager
+def open_engine(backend, *args, **kwargs):
+    """
+    build_engine的上下文管理器版本，参数相同，退出时关闭由它打开的摘要缓存，传入的cache由调用方负责关闭。
+    """
+    engine = build_engine(backend, *args, **kwargs)
+    try:
+        yield engine
+    finally:
+        if engine.cache is not None and kwargs.get("cache") is None:
+            engine.cache.close()
 
-    # 收集所有 .java 文件路径
+
+def summarize_file(file_path, model, cache=None):
+    """
+    读取文件内容，生成摘要，返回(文件路径, 摘要)。
+    传入cache时先按文件的blob哈希查询缓存，命中则不再调用模型。
+    """
+    with open_engine(GLMBackend(model), max_in_flight=1, use_cache=False, cache=cache) as engine:
+        path, summary, _ = asyncio.run(engine.summarize_file(file_path))
+    return path, summary
+
+
+def collect_java_files(root_folder):
+    """
+    递归收集 root_folder 下所有 .java 文件路径。
+    """
     file_paths = []
     for dirpath, _, filenames in os.walk(root_folder):
         for filename in filenames:
             if filename.endswith(".java"):
                 file_paths.append(os.path.join(dirpath, filename))
+    return file_paths
+
+
+def missing_java_files(root_folder, summarized, stale=(), key=None):
+    """
+    返回root_folder中既没有摘要（不在summarized里）也不在stale里的Java文件，按路径排序。
+    key把collect_java_files返回的路径转换为summarized中使用的形式，例如相对路径。
+    增量摘要用它补上在base_commit时因失败等原因缺少摘要的文件，摘要缓存命中时不会重复请求。
+    """
+    key = key or (lambda file: file)
+    return sorted(file for file in collect_java_files(root_folder)
+                  if key(file) not in summarized and key(file) not in stale)
+
+
+def plan_incremental_summary(root_folder, base_commit, target_commit="HEAD"):
+    """
+    根据 git diff --name-status 计算从base_commit到target_commit需要重新总结和需要移除的Java文件。
+    返回(需要重新总结的文件路径列表, 需要移除的文件路径列表)，路径与collect_java_files的格式一致。
+    """
+    success, changes = diff_name_status(root_folder, base_commit, target_commit)
+    if not success:
+        raise RuntimeError(changes)
+
+    def to_path(git_path):
+        return os.path.join(root_folder, *git_path.split("/"))
+
+    changed, removed = [], []
+    for status, path, new_path in changes:
+        if status == "R":
+            # 重命名：旧路径移除，新路径重新总结
+            if path.endswith(".java"):
+                removed.append(to_path(path))
+            path = new_path
+        elif status == "C":
+            path = new_path
+        elif status == "D":
+            if path.endswith(".java"):
+                removed.append(to_path(path))
+            continue
+        if path.endswith(".java"):
+            changed.append(to_path(path))
+    return changed, removed
+
+
+def summarize_files(file_paths, max_workers=5, use_cache=True, requests_per_minute=None, pack_token_budget=None):
+    """
+    并发生成给定文件的摘要，返回{文件路径: 摘要}。
+    max_workers为同时进行中的请求数上限，requests_per_minute为每分钟请求数上限，
+    pack_token_budget不为None时把小文件打包到同一个请求中。
+    """
+    # 初始化 ChatGLM 模型
+    model = ChatGLM(model_type=ModelType.GLM_4)
+    with open_engine(GLMBackend(model), max_workers, requests_per_minute, use_cache,
+                     pack_token_budget=pack_token_budget) as engine:
+        results = asyncio.run(engine.summarize_files(file_paths))
+    return {file: summary for file, summary, _ in results if summary}
+
+
+def summarize_spring_boot_folder(root_folder, max_workers=5, use_cache=True, requests_per_minute=None,
+                                 pack_token_budget=None):
+    """
+    递归遍历 root_folder 下所有 Java 文件，并发生成摘要。
+    """
+    return summarize_files(collect_java_files(root_folder), max_workers, use_cache, requests_per_minute,
+                           pack_token_budget)
+
+
+def summarize_files_to_store(file_paths, store, max_workers=5, use_cache=True, requests_per_minute=None,
+                             pack_token_budget=None):
+    """
+    并发生成摘要并逐条写入store(utils.summary_store.SummaryStore)。
+    store中已经存在的文件会被跳过，因此中断后使用同一个store重新运行即可从断点继续。
+    返回本次新写入的摘要数量。
+    """
+    done = store.done_paths()
+    pending = [file for file in file_paths if file not in done]
+    if len(pending) < len(file_paths):
+        print(f"断点续跑：跳过 {len(file_paths) - len(pending)} 个已完成的文件")
 
-    summaries = {}
+    model = ChatGLM(model_type=ModelType.GLM_4)
+    with open_engine(GLMBackend(model), max_workers, requests_per_minute, use_cache,
+                     pack_token_budget=pack_token_budget) as engine:
+        return asyncio.run(engine.summarize_files_to_sink(pending, store.add))
 
-    # 使用 ThreadPoolExecutor 并发处理文件
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_to_file = {executor.submit(summarize_file, file, model): file for file in file_paths}
 
-        for future in concurrent.futures.as_completed(future_to_file):
-            file, summary = future.result()
-            if summary:
-                summaries[file] = summary
+def summarize_changed_files(root_folder, previous_summaries, base_commit, target_commit="HEAD", max_workers=5,
+                            use_cache=True, requests_per_minute=None, pack_token_budget=None):
+    """
+    在base_commit的摘要集合previous_summaries基础上，只重新总结到target_commit之间新增、修改或重命名的文件，
+    已删除的文件从结果中移除，其余文件的摘要直接沿用。
+    root_folder中不在previous_summaries里的Java文件（例如在base_commit时总结失败）也会重新总结。
+    """
+    changed, removed = plan_incremental_summary(root_folder, base_commit, target_commit)
+    missing = missing_java_files(root_folder, previous_summaries, set(changed))
+    changed = changed + missing
+    print(f"增量摘要：{len(changed)} 个文件需要重新总结（其中{len(missing)}个缺少摘要），{len(removed)} 个文件被移除")
 
+    summaries = dict(previous_summaries)
+    for file in removed + changed:
+        summaries.pop(file, None)
+    summaries.update(summarize_files(changed, max_workers, use_cache, requests_per_minute, pack_token_budget))
     return summaries
 
 
+def summarize_changed_files_to_store(root_folder, store, previous_summaries, base_commit, target_commit="HEAD",
+                                     max_workers=5, use_cache=True, requests_per_minute=None, pack_token_budget=None):
+    """
+    summarize_changed_files的流式版本：沿用的摘要和新生成的摘要都直接写入store。
+    previous_summaries可以是字典，也可以是(文件路径, 摘要)的可迭代对象。
+    root_folder中不在previous_summaries里的Java文件（例如在base_commit时总结失败）也会重新总结。
+    """
+    changed, removed = plan_incremental_summary(root_folder, base_commit, target_commit)
+    stale = set(removed + changed)
+    items = previous_summaries.items() if isinstance(previous_summaries, dict) else previous_summaries
+    # 沿用的摘要边读边写入store，只记录文件路径，用于找出缺少摘要的文件
+    copied = set()
+
+    def reused():
+        for file, summary in items:
+            if file not in stale:
+                copied.add(file)
+                yield file, summary
+
+    store.add_many(reused())
+    missing = missing_java_files(root_folder, copied, stale)
+    changed = changed + missing
+    print(f"增量摘要：{len(changed)} 个文件需要重新总结（其中{len(missing)}个缺少摘要），{len(removed)} 个文件被移除")
+    return summarize_files_to_store(changed, store, max_workers, use_cache, requests_per_minute, pack_token_budget)
+
+
 if __name__ == "__main__":
     spring_boot_folder = "/Users/tangxiaoxia/IdeaProjects/autodrive"
     result = summarize_spring_boot_folder(spring_boot_folder, max_workers=10)
@@ -7,72 +7,71 @@ import os
 from volcenginesdkarkruntime import AsyncArk
 
 import config
-from summarize import generate_prompt
+from summarize import collect_java_files, missing_java_files, open_engine, plan_incremental_summary
+from utils.summary_engine import ArkBatchBackend
 
+# 批量推理接口适合高并发，但仍需限制同时进行中的请求数，避免一次性向服务端提交整个仓库
+MAX_IN_FLIGHT = 500
 
-async def summarize_file(file_path, ark_client, ark_bi_model, rel_path=False, project_root=None, print_log=False):
+
+async def summarize_file(file_path, ark_client, ark_bi_model, rel_path=False, project_root=None, print_log=False,
+                         use_cache=True):
     """
-    读取文件内容，生成摘要。
-    rel_path为True时，返回的也是相对路径而非绝对路径。
+    读取文件内容，生成摘要，返回(文件路径，摘要，prompt)。
+    rel_path为True时，返回的也是相对路径而非绝对路径。缓存命中时prompt为None。
     """
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-    except Exception as e:
-        print(f"读取文件 {file_path} 失败：{e}")
-        return file_path, None, None
-
-    prompt = generate_prompt(file_path, content, rel_path, project_root)
-
-    file_path_rel = file_path
-    if rel_path:
-        file_path_rel = os.path.relpath(file_path, project_root)
-
-    if print_log:
-        print(f"prompt: \n{prompt}\n")
-
-    try:
-        completion = await ark_client.batch_chat.completions.create(
-            model=ark_bi_model,
-            messages=[
-                {"role": "system", "content": prompt},
-            ],
-        )
-
-        summary = completion.choices[0].message.content
-
-        if print_log:
-            print(f"summary：\n{summary}\n")
+    with open_engine(ArkBatchBackend(ark_client, ark_bi_model), 1, use_cache=use_cache,
+                     print_log=print_log) as engine:
+        return await engine.summarize_file(file_path, project_root, rel_path)
 
-        if rel_path:
-            return file_path_rel, summary, prompt
-        else:
-            return file_path, summary, prompt
-    except Exception as e:
-        print(f"生成摘要失败：{e}")
 
-        if rel_path:
-            return file_path_rel, None, prompt
-        else:
-            return file_path, None, prompt
+async def summarize_files(file_paths, root_folder, ark_client, ark_bi_model, rel_path=False, print_log=False,
+                          max_in_flight=MAX_IN_FLIGHT, requests_per_minute=None, use_cache=True,
+                          pack_token_budget=None):
+    """
+    并发生成给定文件的摘要，返回按文件路径排序的三元组列表(文件路径，摘要，prompt)。
+    rel_path为True时，返回的也是相对路径而非绝对路径。
+    """
+    with open_engine(ArkBatchBackend(ark_client, ark_bi_model), max_in_flight, requests_per_minute, use_cache,
+                     print_log, pack_token_budget) as engine:
+        return await engine.summarize_files(file_paths, root_folder, rel_path)
 
 
-async def summarize_spring_boot_folder(root_folder, ark_client, ark_bi_model, rel_path=False, print_log=False):
+async def summarize_spring_boot_folder(root_folder, ark_client, ark_bi_model, rel_path=False, print_log=False,
+                                       max_in_flight=MAX_IN_FLIGHT, requests_per_minute=None, use_cache=True,
+                                       pack_token_budget=None):
     """
     递归遍历 root_folder 下所有 Java 文件，并发生成摘要。
     返回按文件路径排序的三元组列表(文件路径，摘要，prompt)。
     """
-    # 收集所有 .java 文件路径
-    file_paths = []
-    for dirpath, _, filenames in os.walk(root_folder):
-        for filename in filenames:
-            if filename.endswith(".java"):
-                file_paths.append(os.path.join(dirpath, filename))
-
-    tasks = [summarize_file(file, ark_client, ark_bi_model, rel_path, root_folder, print_log) for file in file_paths]
+    return await summarize_files(collect_java_files(root_folder), root_folder, ark_client, ark_bi_model, rel_path,
+                                 print_log, max_in_flight, requests_per_minute, use_cache, pack_token_budget)
 
-    results = await asyncio.gather(*tasks)
 
+async def summarize_changed_files(root_folder, previous_results, base_commit, ark_client, ark_bi_model,
+                                  target_commit="HEAD", rel_path=False, print_log=False,
+                                  max_in_flight=MAX_IN_FLIGHT, requests_per_minute=None, use_cache=True,
+                                  pack_token_budget=None):
+    """
+    在base_commit的摘要结果previous_results基础上，只重新总结到target_commit之间发生变化的文件，
+    以及previous_results中缺少摘要的文件。
+    previous_results与summarize_spring_boot_folder的返回值格式相同，且需使用相同的rel_path。
+    返回按文件路径排序的三元组列表(文件路径，摘要，prompt)。
+    """
+    changed, removed = plan_incremental_summary(root_folder, base_commit, target_commit)
+
+    def key(file):
+        return os.path.relpath(file, root_folder) if rel_path else file
+
+    stale = {key(file) for file in removed + changed}
+    results = [result for result in previous_results if result[0] not in stale]
+    # base_commit时缺少摘要的文件（例如总结失败）也重新总结
+    missing = missing_java_files(root_folder, {result[0] for result in results}, stale, key)
+    changed = changed + missing
+    print(f"增量摘要：{len(changed)} 个文件需要重新总结（其中{len(missing)}个缺少摘要），{len(removed)} 个文件被移除")
+    results.extend(await summarize_files(changed, root_folder, ark_client, ark_bi_model, rel_path, print_log,
+                                         max_in_flight, requests_per_minute, use_cache, pack_token_budget))
+    results.sort(key=lambda x: x[0])
     return results
 
 
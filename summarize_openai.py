@@ -2,77 +2,76 @@
 使用openai接口实现的总结文件
 """
 
+import asyncio
 import datetime
 import os
-import concurrent.futures
 
 from openai import OpenAI
 
 import config
-from summarize import generate_prompt
+from summarize import collect_java_files, missing_java_files, open_engine, plan_incremental_summary
+from utils.summary_engine import OpenAIBackend
 
 
-def summarize_file(file_path, openai_client, openai_model, rel_path=False, project_root=None, print_log=False):
+def summarize_file(file_path, openai_client, openai_model, rel_path=False, project_root=None, print_log=False,
+                   use_cache=True):
     """
-    读取文件内容，生成摘要。
+    读取文件内容，生成摘要，返回(文件路径，摘要，prompt)。
+    rel_path只影响提示词中的文件路径，返回的始终是传入的文件路径。缓存命中时prompt为None。
     """
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-    except Exception as e:
-        print(f"读取文件 {file_path} 失败：{e}")
-        return file_path, None, None
-
-    prompt = generate_prompt(file_path, content, rel_path, project_root)
-
-    if print_log:
-        print(f"prompt: \n{prompt}\n")
-
-    completion = openai_client.chat.completions.create(
-        model=openai_model,
-        messages=[
-            {"role": "system", "content": prompt},
-        ],
-    )
-
-    summary = completion.choices[0].message.content
+    with open_engine(OpenAIBackend(openai_client, openai_model), 1, use_cache=use_cache,
+                     print_log=print_log) as engine:
+        _, summary, prompt = asyncio.run(engine.summarize_file(file_path, project_root, rel_path))
+    return file_path, summary, prompt
 
-    if print_log:
-        print(f"summary：\n{summary}\n")
 
-    return file_path, summary, prompt
+def summarize_files(file_paths, root_folder, openai_client, openai_model, max_workers=5, rel_path=False,
+                    print_log=False, requests_per_minute=None, use_cache=True, pack_token_budget=None):
+    """
+    并发生成给定文件的摘要，返回按文件路径排序的三元组列表(文件路径，摘要，prompt)。
+    max_workers为同时进行中的请求数上限，requests_per_minute为每分钟请求数上限。
+    rel_path只影响提示词中的文件路径，返回的始终是传入的文件路径。
+    """
+    with open_engine(OpenAIBackend(openai_client, openai_model), max_workers, requests_per_minute, use_cache,
+                     print_log, pack_token_budget) as engine:
+        results = asyncio.run(engine.summarize_files(file_paths, root_folder, rel_path))
+    if rel_path:
+        # 引擎按相对路径返回结果，换回传入的路径
+        paths = {os.path.relpath(file, root_folder): file for file in file_paths}
+        results = sorted((paths[path], summary, prompt) for path, summary, prompt in results)
+    return [result for result in results if result[1]]
 
 
 def summarize_spring_boot_folder(root_folder, openai_client, openai_model, max_workers=5, rel_path=False,
-                                 print_log=False):
+                                 print_log=False, requests_per_minute=None, use_cache=True, pack_token_budget=None):
     """
     递归遍历 root_folder 下所有 Java 文件，并发生成摘要。
     返回按文件路径排序的三元组列表(文件路径，摘要，prompt)。
     """
-    # 收集所有 .java 文件路径
-    file_paths = []
-    for dirpath, _, filenames in os.walk(root_folder):
-        for filename in filenames:
-            if filename.endswith(".java"):
-                file_paths.append(os.path.join(dirpath, filename))
-
-    results = []
-
-    # 使用 ThreadPoolExecutor 并发处理文件
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_to_file = {
-            executor.submit(summarize_file, file, openai_client, openai_model, rel_path, root_folder, print_log): file
-            for file in file_paths
-        }
-
-        for future in concurrent.futures.as_completed(future_to_file):
-            file_path, summary, prompt = future.result()
-            if summary:
-                results.append((file_path, summary, prompt))
-
-    # 按文件路径排序
-    results.sort(key=lambda x: x[0])
+    return summarize_files(collect_java_files(root_folder), root_folder, openai_client, openai_model, max_workers,
+                           rel_path, print_log, requests_per_minute, use_cache, pack_token_budget)
+
 
+def summarize_changed_files(root_folder, previous_results, base_commit, openai_client, openai_model,
+                            target_commit="HEAD", max_workers=5, rel_path=False, print_log=False,
+                            requests_per_minute=None, use_cache=True, pack_token_budget=None):
+    """
+    在base_commit的摘要结果previous_results基础上，只重新总结到target_commit之间发生变化的文件，
+    以及previous_results中缺少摘要的文件。
+    previous_results与summarize_spring_boot_folder的返回值格式相同。
+    返回按文件路径排序的三元组列表(文件路径，摘要，prompt)。
+    """
+    changed, removed = plan_incremental_summary(root_folder, base_commit, target_commit)
+
+    stale = set(removed + changed)
+    results = [result for result in previous_results if result[0] not in stale]
+    # base_commit时缺少摘要的文件（例如总结失败）也重新总结
+    missing = missing_java_files(root_folder, {result[0] for result in results}, stale)
+    changed = changed + missing
+    print(f"增量摘要：{len(changed)} 个文件需要重新总结（其中{len(missing)}个缺少摘要），{len(removed)} 个文件被移除")
+    results.extend(summarize_files(changed, root_folder, openai_client, openai_model, max_workers, rel_path,
+                                   print_log, requests_per_minute, use_cache, pack_token_budget))
+    results.sort(key=lambda x: x[0])
     return results
 
 
@@ -84,7 +83,7 @@ if __name__ == "__main__":
         base_url=config.deepseek_base_url,
     )
 
-    result = summarize_spring_boot_folder(spring_boot_folder, client, config.deepseek_model, max_workers=1,
+    result = summarize_spring_boot_folder(spring_boot_folder, client, config.deepseek_model, max_workers=10,
                                           rel_path=True, print_log=True)
 
     # 创建保存目录
@@ -0,0 +1,28 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
+
+from utils.rag.ann import build_faiss_index, recall_report
+
+
+def test_recall_report_against_exact():
+    rng = np.random.default_rng(0)
+    vectors = rng.random((2000, 32), dtype=np.float32)
+    rows = recall_report(vectors, vectors[:50], k=5, configs=[
+        {"index_type": "ivf_flat", "nlist": 16, "nprobe": 16},
+        {"index_type": "hnsw", "ef_search": 128},
+    ])
+    assert [row["config"] for row in rows] == ["flat", "index_type=ivf_flat, nlist=16, nprobe=16",
+                                               "index_type=hnsw, ef_search=128"]
+    # nprobe等于nlist时IVF退化为精确检索
+    assert rows[1]["recall"] == 1.0
+    assert rows[2]["recall"] > 0.9
+
+
+def test_ivf_pq_requires_divisible_dimension():
+    with pytest.raises(ValueError):
+        build_faiss_index(np.zeros((100, 30), dtype=np.float32), "ivf_pq", pq_m=16)
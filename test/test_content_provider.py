@@ -0,0 +1,25 @@
+import os
+import sys
+import types
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
+
+from utils.rag.content_provider import RAGContentProvider, SQLiteStrategy
+from utils.summary_store import SummaryStore
+
+
+def test_sqlite_source_streams_rows_in_batches(tmp_path):
+    store = SummaryStore(str(tmp_path / "summary.db"))
+    store.add_many([(f"src/F{i}.java", f"summary of F{i}") for i in range(5)] + [("src/Short.java", "x")])
+    store.close()
+
+    strategy = SQLiteStrategy(tmp_path / "summary.db", blobs={"src/F0.java": "b0"})
+    assert isinstance(strategy.process(), types.GeneratorType)
+
+    provider = RAGContentProvider(str(tmp_path))
+    provider.add_sqlite_file("summary.db", blobs={"src/F0.java": "b0"})
+    batches = list(provider.iter_documents(batch_size=2))
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    first = batches[0][0]
+    assert first.page_content == "summary of F0\n Source: src/F0.java"
+    assert first.metadata == {"source": "src/F0.java", "blob": "b0"}
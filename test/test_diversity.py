@@ -0,0 +1,47 @@
+import os
+import sys
+
+import numpy as np
+from langchain_community.vectorstores import FAISS
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
+
+from utils.rag.diversity import mmr_select
+from utils.rag.embedding import HashingEmbeddings
+from utils.rag.rag_system import RAGSystem
+
+
+def test_mmr_prefers_dissimilar_candidates():
+    vectors = np.asarray([[1, 0], [1, 0.01], [0, 1]], dtype=np.float32)
+    assert mmr_select([1.0, 0.99, 0.8], 2) == [0, 1]
+    assert mmr_select([1.0, 0.99, 0.8], 2, vectors, lambda_mult=0.5) == [0, 2]
+
+
+def test_mmr_limits_candidates_per_group():
+    groups = ["a.java", "a.java", "b.java", None, None]
+    assert mmr_select([5, 4, 3, 2, 1], 5, groups=groups, max_per_group=1) == [0, 2, 3, 4]
+
+
+def test_retrieve_with_path_prefix_and_source_dedup():
+    texts, metadatas = [], []
+    for source in ["/repo/src/order/OrderService.java", "/repo/src/user/UserService.java",
+                   "/repo/src/user/UserController.java"]:
+        for i in range(3):
+            texts.append(f"用户登录 login user {source} part{i}")
+            metadatas.append({"source": source, "blob": "b"})
+    embeddings = HashingEmbeddings()
+    store = FAISS.from_texts(texts, embeddings, metadatas)
+    rag = RAGSystem(None, embeddings, store, None, None, 5)
+
+    rag.set_path_prefixes(["src/user"])
+    sources = [doc.metadata["source"] for doc in rag.retrieve("用户登录 login")]
+    assert len(sources) == 5 and all("/src/user/" in source for source in sources)
+
+    rag.max_per_source = 1
+    rag.mmr_lambda = 0.7
+    sources = [doc.metadata["source"] for doc in rag.retrieve("用户登录 login")]
+    assert sorted(sources) == ["/repo/src/user/UserController.java", "/repo/src/user/UserService.java"]
+
+    rag.set_path_prefixes(None)
+    rag.set_visible_versions([("/repo/src/order/OrderService.java", "b")])
+    assert [doc.metadata["source"] for doc in rag.retrieve("用户登录 login")] == ["/repo/src/order/OrderService.java"]
@@ -0,0 +1,51 @@
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
+
+from utils.rag.embedding_cache import EmbeddingCache
+
+
+def vector(i):
+    return [float(i), float(i) + 0.5]
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = EmbeddingCache("model", str(tmp_path), max_entries=2)
+    cache.put_many(["a", "b"], [vector(0), vector(1)])
+    time.sleep(0.01)
+    cache.get_many(["a"])
+    time.sleep(0.01)
+    cache.put_many(["c"], [vector(2)])
+    a, b, c = cache.get_many(["a", "b", "c"])
+    assert b is None
+    assert np.allclose(a, vector(0)) and np.allclose(c, vector(2))
+    assert len(cache) == 2
+    cache.close()
+
+
+def test_reopen_with_smaller_and_larger_capacity(tmp_path):
+    texts = [f"text{i}" for i in range(5)]
+    cache = EmbeddingCache("model", str(tmp_path), max_entries=5)
+    for i, text in enumerate(texts):
+        cache.put_many([text], [vector(i)])
+        time.sleep(0.01)
+    cache.close()
+
+    cache = EmbeddingCache("model", str(tmp_path), max_entries=2)
+    assert len(cache) == 2
+    hits = cache.get_many(texts)
+    assert hits[:3] == [None, None, None]
+    assert np.allclose(hits[3], vector(3)) and np.allclose(hits[4], vector(4))
+    cache.put_many(["new"], [vector(9)])
+    assert len(cache) == 2
+    cache.close()
+
+    cache = EmbeddingCache("model", str(tmp_path), max_entries=4)
+    cache.put_many(["x", "y"], [vector(7), vector(8)])
+    assert len(cache) == 4
+    assert all(hit is not None for hit in cache.get_many(["new", "x", "y"]))
+    cache.close()
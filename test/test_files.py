@@ -0,0 +1,30 @@
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
+
+from utils.files import concat_code_files, read_and_replace_prompt
+
+
+def test_concat_code_files_is_sorted_and_respects_budget(tmp_path):
+    (tmp_path / "b").mkdir()
+    (tmp_path / "b" / "Big.java").write_text("x" * 3000, encoding="utf-8")
+    (tmp_path / "b" / "A.java").write_text("class A {}", encoding="utf-8")
+    (tmp_path / "a.java").write_text("class Root {}", encoding="utf-8")
+    (tmp_path / "notes.txt").write_text("ignored", encoding="utf-8")
+    is_java = lambda x: x.endswith(".java")
+
+    full = concat_code_files(str(tmp_path), is_java, use_relative_path=True)
+    names = [line for line in full.splitlines() if line.startswith("文件名: ")]
+    assert names == ["文件名: a.java", f"文件名: {os.path.join('b', 'A.java')}", f"文件名: {os.path.join('b', 'Big.java')}"]
+
+    packed = concat_code_files(str(tmp_path), is_java, use_relative_path=True, token_budget=100)
+    assert "class Root {}" in packed and "class A {}" in packed and "xxx" not in packed
+    assert packed.endswith(f"以下文件因超出长度限制未包含内容:\n文件名: {os.path.join('b', 'Big.java')}\n\n")
+
+
+def test_read_and_replace_prompt_single_pass(tmp_path):
+    prompt_file = tmp_path / "prompt.txt"
+    prompt_file.write_text("{{code_repo}}\n{{commit_msg}} {{summary}}", encoding="utf-8")
+    prompt = read_and_replace_prompt(str(prompt_file), {"code_repo": "{{commit_msg}}", "commit_msg": "fix"})
+    assert prompt == "{{commit_msg}}\nfix {{summary}}"
@@ -0,0 +1,81 @@
+import os
+import subprocess
+import sys
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
+from summarize import missing_java_files, plan_incremental_summary
+from utils.git import diff_name_status, get_head_commit, git_blob_hash, ls_tree_blobs
+
+
+def git(repo, *args):
+    subprocess.run(["git", "-C", repo, *args], check=True, capture_output=True)
+
+
+def write(repo, path, content):
+    full_path = os.path.join(repo, path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    with open(full_path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+def test_plan_incremental_summary():
+    repo = tempfile.mkdtemp()
+    git(repo, "init", "-q")
+    git(repo, "config", "user.email", "test@example.com")
+    git(repo, "config", "user.name", "test")
+    write(repo, "src/A.java", "class A {}\n")
+    write(repo, "src/B.java", "class B { int b; }\n" * 20)
+    write(repo, "src/C.java", "class C {}\n")
+    write(repo, "README.md", "readme\n")
+    git(repo, "add", "-A")
+    git(repo, "commit", "-qm", "base")
+    base = get_head_commit(repo)
+
+    write(repo, "src/A.java", "class A { void a() {} }\n")
+    git(repo, "mv", "src/B.java", "src/D.java")
+    git(repo, "rm", "-q", "src/C.java")
+    write(repo, "src/E.java", "class E {}\n")
+    write(repo, "README.md", "changed\n")
+    git(repo, "add", "-A")
+    git(repo, "commit", "-qm", "next")
+
+    success, changes = diff_name_status(repo, base)
+    assert success
+    assert ("R", "src/B.java", "src/D.java") in [(s, p, n) for s, p, n in changes]
+
+    changed, removed = plan_incremental_summary(repo, base)
+    src = os.path.join(repo, "src")
+    assert sorted(changed) == [os.path.join(src, name) for name in ("A.java", "D.java", "E.java")]
+    assert sorted(removed) == [os.path.join(src, name) for name in ("B.java", "C.java")]
+
+
+def test_missing_java_files_include_unsummarized_files():
+    root = tempfile.mkdtemp()
+    for path in ("src/A.java", "src/B.java", "src/C.java", "README.md"):
+        write(root, path, "class X {}\n")
+    src = os.path.join(root, "src")
+    summarized = {os.path.join(src, "A.java"): "summary"}
+    assert missing_java_files(root, summarized, {os.path.join(src, "C.java")}) == [os.path.join(src, "B.java")]
+    assert missing_java_files(root, {"src/A.java"}, key=lambda file: os.path.relpath(file, root).replace(os.sep, "/")) \
+        == [os.path.join(src, "B.java"), os.path.join(src, "C.java")]
+
+
+def test_git_blob_hash():
+    # `git hash-object` 对 "hello\n" 的结果
+    assert git_blob_hash(b"hello\n") == "ce013625030ba8dba906f756967f9e9ca394464a"
+
+
+def test_ls_tree_blobs_relative_to_project_root():
+    repo = tempfile.mkdtemp()
+    git(repo, "init", "-q")
+    git(repo, "config", "user.email", "test@example.com")
+    git(repo, "config", "user.name", "test")
+    write(repo, "app/src/A.java", "hello\n")
+    write(repo, "README.md", "readme\n")
+    git(repo, "add", "-A")
+    git(repo, "commit", "-qm", "base")
+
+    success, blobs = ls_tree_blobs(os.path.join(repo, "app"))
+    assert success
+    assert blobs == {"src/A.java": git_blob_hash(b"hello\n")}
@@ -0,0 +1,27 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
+
+from utils.rag.embedding import HashingEmbeddings
+
+
+def test_hashing_embeddings_are_deterministic_and_normalized():
+    embeddings = HashingEmbeddings(n_features=256)
+    vectors = np.asarray(embeddings.embed_documents(["UserController 处理用户登录", ""]))
+    assert vectors.shape == (2, 256)
+    assert np.isclose(np.linalg.norm(vectors[0]), 1.0)
+    assert not vectors[1].any()
+    assert embeddings.embed_query("UserController 处理用户登录") == vectors[0].tolist()
+
+
+def test_hashing_embeddings_rank_shared_identifiers_higher():
+    embeddings = HashingEmbeddings()
+    query = np.asarray(embeddings.embed_query("修复 UserController 登录失败"))
+    related, unrelated = np.asarray(embeddings.embed_documents([
+        "UserController 负责用户登录和注销",
+        "OrderService 负责订单查询",
+    ]))
+    assert query @ related > query @ unrelated
@@ -0,0 +1,53 @@
+import os
+import sys
+
+import numpy as np
+from langchain_community.embeddings import FakeEmbeddings
+from langchain_community.vectorstores import FAISS
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
+
+from utils.rag.hierarchy import PackageIndex, matches_path_prefix, package_of
+
+
+def test_package_of():
+    assert package_of("src/main/java/com/demo/UserService.java") == "src/main/java/com/demo"
+    assert package_of("src\\demo\\A.java") == "src/demo"
+    assert package_of(None) == ""
+
+
+def test_matches_path_prefix_at_component_boundary():
+    assert matches_path_prefix("/repo/src/user/A.java", "src/user")
+    assert matches_path_prefix("/repo/src/user/A.java", "src/user/")
+    assert matches_path_prefix("src\\user\\A.java", "src/user")
+    assert not matches_path_prefix("/repo/src/userprofile/B.java", "src/user")
+    assert not matches_path_prefix("/repo/mysrc/user/B.java", "src/user")
+
+
+def test_matches_absolute_path_prefix_from_start():
+    assert matches_path_prefix("/repo/src/main/X.java", "/repo/src/main")
+    assert matches_path_prefix("/repo/src/main/X.java", "/repo/src/main/X.java")
+    assert not matches_path_prefix("/other/repo/src/main/X.java", "/repo/src/main")
+    assert matches_path_prefix("C:\\repo\\src\\X.java", "C:/repo")
+    assert not matches_path_prefix("D:/C:/repo/X.java", "C:/repo")
+
+
+def test_search_only_inside_nearest_packages():
+    vectors, metadatas = [], []
+    for package in range(4):
+        for i in range(10):
+            vector = np.zeros(8, dtype=np.float32)
+            vector[package] = 10
+            vector[4 + i % 4] = i * 0.1
+            vectors.append(vector.tolist())
+            metadatas.append({"source": f"pkg{package}/F{i}.java"})
+    texts = [metadata["source"] for metadata in metadatas]
+    store = FAISS.from_embeddings(zip(texts, vectors), FakeEmbeddings(size=8), metadatas)
+
+    index = PackageIndex(store)
+    assert index.packages == ["pkg0", "pkg1", "pkg2", "pkg3"]
+    query = np.asarray([vectors[25]], dtype=np.float32)
+    doc_ids = index.search(query, 3, 1)[0]
+    sources = [store.docstore.search(doc_id).metadata["source"] for doc_id in doc_ids]
+    assert sources[0] == "pkg2/F5.java"
+    assert all(source.startswith("pkg2/") for source in sources)
@@ -0,0 +1,83 @@
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
+
+from langchain_community.vectorstores import FAISS
+
+from utils.rag.embedding import HashingEmbeddings
+from utils.rag.index_store import is_faiss_dir
+from utils.rag.lexical import BM25Index, StoredBM25Index, lexical_text
+from utils.rag.rag_system import RAGSystem
+
+TEXTS = [f"F{i}.java 用户登录 login{i}" for i in range(10)]
+METADATAS = [{"source": f"src/F{i}.java", "blob": f"b{i}"} for i in range(10)]
+
+
+def test_save_and_load_round_trip(tmp_path):
+    embeddings = HashingEmbeddings()
+    rag = RAGSystem(None, embeddings, FAISS.from_texts(TEXTS, embeddings, METADATAS), None, None, 3)
+    # 路径中带有URI中的特殊字符
+    path = str(tmp_path / "index?v=1#50%")
+    rag.save_index(path)
+    assert is_faiss_dir(path)
+
+    loaded = RAGSystem.load_index(path, None, embeddings)
+    assert loaded.index.index.ntotal == 10
+    assert [doc.page_content for doc in loaded.retrieve("F3.java login3", 1)] == [TEXTS[3]]
+    assert loaded.retrieve("F3.java login3", 1)[0].metadata == METADATAS[3]
+
+    loaded.remove_sources(["src/F3.java"])
+    assert loaded.index.index.ntotal == 9
+    assert RAGSystem.load_index(path, None, embeddings).index.index.ntotal == 10
+
+
+def test_load_legacy_pickled_index(tmp_path):
+    embeddings = HashingEmbeddings()
+    path = str(tmp_path / "index.bin")
+    with open(path, "wb") as f:
+        f.write(FAISS.from_texts(TEXTS, embeddings, METADATAS).serialize_to_bytes())
+
+    loaded = RAGSystem.load_index(path, None, embeddings)
+    assert [doc.page_content for doc in loaded.retrieve("F7.java login7", 1)] == [TEXTS[7]]
+
+
+def test_version_positions_read_from_docstore_columns(tmp_path):
+    embeddings = HashingEmbeddings()
+    path = str(tmp_path / "index")
+    RAGSystem(None, embeddings, FAISS.from_texts(TEXTS, embeddings, METADATAS), None, None, 3).save_index(path)
+
+    loaded = RAGSystem.load_index(path, None, embeddings)
+    assert loaded.index.docstore.version_positions() == {("src/F%d.java" % i, "b%d" % i): [i] for i in range(10)}
+    loaded.set_visible_versions([("src/F2.java", "b2")])
+    assert [doc.page_content for doc in loaded.retrieve("login", 3)] == [TEXTS[2]]
+
+    loaded.remove_sources(["src/F0.java"])
+    assert loaded.index.docstore.version_positions() is None
+    assert loaded._version_positions()[("src/F2.java", "b2")] == [1]
+
+
+def test_bm25_postings_saved_with_docstore(tmp_path):
+    embeddings = HashingEmbeddings()
+    path = str(tmp_path / "index")
+    RAGSystem(None, embeddings, FAISS.from_texts(TEXTS, embeddings, METADATAS), None, None, 3).save_index(path)
+
+    loaded = RAGSystem.load_index(path, None, embeddings)
+    stored = loaded.index.docstore.lexical_index()
+    assert len(stored) == 10
+    expected = BM25Index()
+    for i, (text, metadata) in enumerate(zip(TEXTS, METADATAS)):
+        expected.add(i, lexical_text(text, metadata["source"]))
+    for query in ["F4.java login4", "用户登录 F1"]:
+        assert [(p, round(s, 6)) for p, s in stored.search(query, 3)] == \
+            [(p, round(s, 6)) for p, s in expected.search(query, 3)]
+    assert [p for p, _ in stored.search("login5 login6", 5, {6})] == [6]
+
+    loaded.retrieval_mode = "lexical"
+    loaded.set_visible_versions([("src/F8.java", "b8"), ("src/F9.java", "b9")])
+    assert [doc.page_content for doc in loaded.retrieve("login9", 1)] == [TEXTS[9]]
+    assert isinstance(loaded._lexical, StoredBM25Index)
+
+    loaded.remove_sources(["src/F9.java"])
+    assert loaded.index.docstore.lexical_index() is None
+    assert [doc.page_content for doc in loaded.retrieve("login8", 1)] == [TEXTS[8]]
@@ -0,0 +1,78 @@
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
+from utils.java_source import chunk_java_source, extract_methods, split_java_source
+
+SOURCE = '''package demo;
+
+@Service
+public class UserService<T> {
+    @Autowired
+    private UserRepository repository = new UserRepository(1);
+
+    public UserService(UserRepository repository) {
+        this.repository = repository;
+    }
+
+    @GetMapping("/users")
+    public <K> Map<K, List<T>> findAll(K key,
+                                       Map<String, Integer> options) throws IOException {
+        if (key == null) {
+            return null;
+        }
+        return repository.find("}");
+    }
+
+    abstract void reset();
+}
+'''
+
+
+def test_extract_methods():
+    methods = extract_methods(SOURCE)
+    assert [method.name for method in methods] == ["UserService", "findAll", "reset"]
+    find_all = methods[1]
+    assert find_all.class_name == "UserService"
+    assert find_all.signature == ('@GetMapping("/users") public <K> Map<K, List<T>> findAll(K key, '
+                                  'Map<String, Integer> options) throws IOException')
+    assert (find_all.start_line, find_all.end_line) == (12, 19)
+
+
+def test_split_java_source_at_method_boundaries():
+    chunks = split_java_source(SOURCE, 300)
+    assert "".join(chunks) == SOURCE
+    assert len(chunks) > 1
+    assert all(chunk.endswith("\n") for chunk in chunks)
+
+
+def test_chunk_java_source_by_method():
+    chunks = chunk_java_source(SOURCE)
+    assert [(chunk.method_name, chunk.start_line, chunk.end_line) for chunk in chunks] == [
+        (None, 1, 6), ("UserService", 7, 10), ("findAll", 11, 19), ("reset", 20, 21)]
+    lines = SOURCE.splitlines(keepends=True)
+    assert all(chunk.text == "".join(lines[chunk.start_line - 1:chunk.end_line]) for chunk in chunks)
+
+
+def test_extract_methods_with_named_annotation_arguments():
+    source = '''@RestController
+@RequestMapping(value = "/users", produces = "application/json")
+public class UserController {
+    private final Map<String, User> users = new HashMap<>();
+
+    public UserController() {
+    }
+
+    @GetMapping(value = "/list")
+    public List<User> list() {
+        return new ArrayList<>(users.values());
+    }
+
+    @RequestMapping(value = "/add", method = RequestMethod.POST)
+    @Transactional(rollbackFor = Exception.class)
+    public void add(User user) {
+        users.put(user.getName(), user);
+    }
+}
+'''
+    assert [method.name for method in extract_methods(source)] == ["UserController", "list", "add"]
@@ -0,0 +1,25 @@
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
+
+from utils.rag.lexical import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+def test_tokenize_splits_identifiers():
+    tokens = tokenize("UserController.getHTTPStatus user_id 用户登录")
+    assert {"usercontroller", "user", "controller", "gethttpstatus", "http", "status", "user_id", "id"} <= set(tokens)
+    assert {"用户", "户登", "登录"} <= set(tokens)
+
+
+def test_bm25_prefers_exact_identifier():
+    index = BM25Index()
+    index.add("a", "负责订单查询 Source: src/OrderService.java")
+    index.add("b", "负责用户登录 Source: src/UserController.java")
+    index.add("c", "工具类 Source: src/StringUtils.java")
+    assert index.search("修复UserController登录失败", 2)[0][0] == "b"
+    assert index.search("nothing matches", 2) == []
+
+
+def test_reciprocal_rank_fusion():
+    assert reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]], 2) == ["b", "a"]
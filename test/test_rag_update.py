@@ -0,0 +1,147 @@
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
+
+import pytest
+from langchain_core.documents import Document
+
+from utils.rag.embedding import HashingEmbeddings
+from utils.rag.rag_system import RAGSystem
+
+
+class ListProvider:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def iter_documents(self):
+        yield self.documents
+
+
+class CountingEmbeddings(HashingEmbeddings):
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+        self.texts = []
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        self.texts.extend(texts)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        self.calls += 1
+        return super().embed_query(text)
+
+    def embed_queries(self, texts):
+        self.calls += 1
+        return super().embed_documents(texts)
+
+
+def documents(sources):
+    return [Document(page_content=f"{source} 用户登录 part{i}", metadata={"source": source})
+            for source in sources for i in range(3)]
+
+
+def test_remove_sources_from_hnsw_index():
+    provider = ListProvider(documents(["A.java", "B.java", "C.java"]))
+    rag = RAGSystem.from_content_provider(provider, None, HashingEmbeddings, index_type="hnsw", ef_search=32)
+    rag.retrieval_mode = "vector"
+    assert rag.remove_sources(["B.java"]) == 3
+    assert rag.index.index.ntotal == 6
+    assert {doc.metadata["source"] for doc in rag.retrieve("B.java 用户登录", 6)} == {"A.java", "C.java"}
+    assert rag.index.index.hnsw.efSearch == 32
+
+    added, removed = rag.update_from_content_provider(ListProvider(documents(["A.java", "D.java"])))
+    assert (added, removed) == (3, 3)
+    assert {doc.metadata["source"] for doc in rag.retrieve("用户登录", 6)} == {"A.java", "D.java"}
+
+
+def test_remove_sources_from_ivf_index():
+    sources = [f"F{i}.java" for i in range(40)]
+    rag = RAGSystem.from_content_provider(ListProvider(documents(sources)), None, HashingEmbeddings,
+                                          index_type="ivf_flat", nprobe=16)
+    rag.retrieval_mode = "vector"
+    assert rag.remove_sources(sources[:10]) == 30
+    assert rag.index.index.ntotal == 90
+    retrieved = rag.retrieve("用户登录", 90)
+    assert len(retrieved) == 90 and {doc.metadata["source"] for doc in retrieved} == set(sources[10:])
+
+    rag.add_documents(documents(["New.java"]))
+    retrieved = rag.retrieve("New.java 用户登录", 93)
+    assert sorted(doc.page_content for doc in retrieved) == sorted(
+        doc.page_content for doc in documents(sources[10:] + ["New.java"]))
+
+
+def test_k_factor_reaches_rerank_index(tmp_path):
+    provider = ListProvider(documents([f"F{i}.java" for i in range(20)]))
+    rag = RAGSystem.from_content_provider(provider, None, HashingEmbeddings(n_features=64), index_type="pq",
+                                          pq_m=8, pq_nbits=4, rerank=True, k_factor=4)
+    assert rag.index.index.k_factor == 4
+    path = str(tmp_path / "index")
+    rag.save_index(path)
+    loaded = RAGSystem.load_index(path, None, HashingEmbeddings(n_features=64), k_factor=8)
+    assert loaded.index.index.k_factor == 8
+    assert len(loaded.retrieve("F3.java", 3)) == 3
+
+
+def test_assemble_prompt_without_creating_llm(monkeypatch):
+    monkeypatch.delenv("GLM_API_KEY", raising=False)
+    rag = RAGSystem.from_content_provider(ListProvider(documents(["A.java"])), "{{question}}\n{{context}}",
+                                          HashingEmbeddings, top_k=2)
+    prompt, context = rag.get_assembled_prompt("用户登录", None)
+    assert prompt.startswith("用户登录\n") and len(context) == 2
+    assert rag.llm is None and rag.rag_chain is None
+
+
+def test_assemble_prompts_for_queries_from_different_commits():
+    # 同一个共享索引中A.java有两个版本，两个提交各自只能看到自己的版本
+    docs = [Document(page_content=f"A.java 用户登录 {blob}", metadata={"source": "A.java", "blob": blob})
+            for blob in ["old", "new"]]
+    embeddings = CountingEmbeddings()
+    rag = RAGSystem.from_content_provider(ListProvider(docs), "{{question}}", embeddings, top_k=2)
+    embeddings.calls = 0
+
+    results = rag.get_assembled_prompts([("用户登录", None), ("用户登录", None), ("用户登录", None)],
+                                        versions=[{("A.java", "old")}, {("A.java", "new")}, None])
+    assert embeddings.calls == 1
+    assert [[doc.page_content for doc in context] for _, context in results] == [
+        ["A.java 用户登录 old"], ["A.java 用户登录 new"], ["A.java 用户登录 old", "A.java 用户登录 new"]]
+
+
+def test_load_index_without_embedding_api_key(tmp_path, monkeypatch):
+    monkeypatch.delenv("GLM_API_KEY", raising=False)
+    path = str(tmp_path / "index")
+    RAGSystem.from_content_provider(ListProvider(documents(["A.java", "B.java"])), None, HashingEmbeddings
+                                    ).save_index(path)
+
+    rag = RAGSystem.load_index(path, "{{question}}\n{{context}}")
+    rag.retrieval_mode = "lexical"
+    prompt, context = rag.get_assembled_prompt("B.java", None)
+    assert context[0].metadata["source"] == "B.java"
+    rag.retrieval_mode = "vector"
+    with pytest.raises(ValueError):
+        rag.retrieve("B.java")
+
+
+def test_add_missing_versions_embeds_only_new_versions(tmp_path):
+    def commit(versions):
+        return ListProvider([Document(page_content=f"{source} 用户登录 {blob}", metadata={"source": source, "blob": blob})
+                             for source, blob in versions])
+
+    path = str(tmp_path / "shared.index")
+    RAGSystem.from_content_provider(commit([("A.java", "a1"), ("B.java", "b1")]), None, HashingEmbeddings
+                                    ).save_index(path)
+
+    embeddings = CountingEmbeddings()
+    rag = RAGSystem.load_index(path, None, embeddings)
+    # 第二个提交中A.java没有变化，B.java修改，C.java新增
+    second = [("A.java", "a1"), ("B.java", "b2"), ("C.java", "c1")]
+    assert rag.add_missing_versions(commit(second)) == 2
+    assert sorted(embeddings.texts) == ["B.java 用户登录 b2", "C.java 用户登录 c1"]
+    assert rag.add_missing_versions(commit(second)) == 0
+    assert embeddings.calls == 1
+
+    rag.set_visible_versions(second)
+    assert {doc.page_content for doc in rag.retrieve("B.java 用户登录", 3)} == \
+        {"A.java 用户登录 a1", "B.java 用户登录 b2", "C.java 用户登录 c1"}
@@ -0,0 +1,202 @@
+import asyncio
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
+
+import summarize
+from locate import save_summary
+from summarize import build_engine, open_engine, summarize_file
+from utils.summary_cache import SummaryCache
+from utils.summary_engine import RateLimiter, SummaryBackend, parse_packed_response
+from utils.summary_store import SummaryStore, read_summaries
+
+
+class FakeModel:
+    model_type = SimpleNamespace(model_code="fake")
+
+    def __init__(self):
+        self.calls = 0
+        self.prompts = []
+
+    def __call__(self, prompt):
+        self.calls += 1
+        self.prompts.append(prompt)
+        return "summary"
+
+
+def test_summarize_file_uses_cache(tmp_path):
+    java_file = tmp_path / "A.java"
+    java_file.write_text("class A {}\n", encoding="utf-8")
+    cache = SummaryCache(str(tmp_path / "cache.db"))
+    model = FakeModel()
+    assert summarize_file(str(java_file), model, cache) == (str(java_file), "summary")
+    assert summarize_file(str(java_file), model, cache) == (str(java_file), "summary")
+    assert model.calls == 1
+    assert summarize_file(str(tmp_path / "missing.java"), model) == (str(tmp_path / "missing.java"), None)
+
+
+class FakeBackend(SummaryBackend):
+    model_id = "fake"
+
+    def __init__(self, packed_response):
+        # packed_response(文件路径列表)返回打包请求的模型输出，单文件请求返回"single"
+        self.packed_response = packed_response
+        self.prompts = []
+
+    async def complete(self, prompt):
+        self.prompts.append(prompt)
+        if prompt.startswith("请用中文分别概括"):
+            paths = [line.split("文件：", 1)[1].rstrip(" =") for line in prompt.splitlines()
+                     if line.startswith("===== 文件：")]
+            return self.packed_response(paths)
+        return "single"
+
+
+def write_java_files(tmp_path, sizes):
+    paths = []
+    for name, size in sizes.items():
+        path = tmp_path / f"{name}.java"
+        path.write_text(f"class {name} {{}}\n" + "//" * size, encoding="utf-8")
+        paths.append(str(path))
+    return paths
+
+
+def test_parse_packed_response():
+    assert parse_packed_response('{"A.java": "a", "B.java": ""}') == {"A.java": "a"}
+    assert parse_packed_response('```json\n{"A.java": "a"}\n```') == {"A.java": "a"}
+    assert parse_packed_response('{"A.java": {"功能": "a"}}') == {"A.java": '{"功能": "a"}'}
+    assert parse_packed_response('["A.java"]') == {}
+    assert parse_packed_response("无法按JSON输出") == {}
+
+
+def test_plan_packs(tmp_path):
+    a, b, big, c = write_java_files(tmp_path, {"A": 10, "B": 10, "Big": 3000, "C": 10})
+    engine = build_engine(FakeBackend(None), use_cache=False, pack_token_budget=25, small_file_tokens=1000)
+    # A、B装满一个包，C单独一个包时退回单文件摘要，Big超过small_file_tokens
+    assert engine.plan_packs([c, big, b, a]) == ([big, c], [[a, b]])
+    assert build_engine(FakeBackend(None), use_cache=False).plan_packs([a, b]) == ([a, b], [])
+
+
+def test_summarize_pack_splits_json(tmp_path):
+    paths = write_java_files(tmp_path, {"A": 10, "B": 10})
+    backend = FakeBackend(lambda files: "```json\n" + json.dumps({f: f"packed {f}" for f in files}) + "\n```")
+    engine = build_engine(backend, use_cache=False, pack_token_budget=1000)
+    results = asyncio.run(engine.summarize_files(paths))
+    assert [(path, summary) for path, summary, _ in results] == [(path, f"packed {path}") for path in paths]
+    assert len(backend.prompts) == 1
+
+
+def test_summarize_pack_falls_back_to_single_files(tmp_path):
+    paths = write_java_files(tmp_path, {"A": 10, "B": 10, "C": 10})
+    # 无法解析的输出全部退回单文件摘要，缺少的文件只退回该文件
+    for packed_response, expected in [(lambda files: "无法按JSON输出", ["single"] * 3),
+                                      (lambda files: json.dumps({files[0]: "packed"}),
+                                       ["packed", "single", "single"])]:
+        backend = FakeBackend(packed_response)
+        engine = build_engine(backend, use_cache=False, pack_token_budget=1000)
+        results = asyncio.run(engine.summarize_files(paths))
+        assert [summary for _, summary, _ in results] == expected
+        assert len(backend.prompts) == 1 + expected.count("single")
+
+
+def test_save_summary_resumes_from_checkpoint(tmp_path, monkeypatch):
+    project = tmp_path / "project"
+    project.mkdir()
+    done, *pending = write_java_files(project, {"A": 10, "B": 10, "C": 10})
+    model = FakeModel()
+    monkeypatch.setattr(summarize, "ChatGLM", lambda **kwargs: model)
+    monkeypatch.setattr(summarize, "SummaryCache", lambda: SummaryCache(str(tmp_path / "cache.db")))
+
+    # 模拟上次运行中断：检查点中已经有A的摘要
+    output = str(tmp_path / "summary.db")
+    checkpoint = SummaryStore(output + ".checkpoint.db")
+    checkpoint.add(done, "from checkpoint")
+    checkpoint.close()
+
+    save_summary(str(project), output, "摘要", "文件路径", max_workers=2)
+    assert sorted(prompt.splitlines()[0] for prompt in model.prompts) == \
+        [f"请用中文概括文件：{path}" for path in pending]
+    assert dict(read_summaries(output)) == {done: "from checkpoint", pending[0]: "summary", pending[1]: "summary"}
+    assert not os.path.exists(output + ".checkpoint.db")
+
+
+class SlowBackend(SummaryBackend):
+    model_id = "slow"
+
+    def __init__(self):
+        self.running = 0
+        self.max_running = 0
+        self.start_times = []
+
+    async def complete(self, prompt):
+        self.start_times.append(asyncio.get_running_loop().time())
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(0.02)
+        self.running -= 1
+        return "summary"
+
+
+def test_summary_backend_requires_complete():
+    with pytest.raises(TypeError):
+        SummaryBackend()
+
+
+def test_engine_limits_requests_in_flight(tmp_path):
+    paths = write_java_files(tmp_path, {name: 10 for name in "ABCDEF"})
+    backend = SlowBackend()
+    results = asyncio.run(build_engine(backend, max_in_flight=2, use_cache=False).summarize_files(paths))
+    assert [summary for _, summary, _ in results] == ["summary"] * 6
+    assert backend.max_running == 2
+
+
+def test_engine_limits_requests_per_minute(tmp_path):
+    paths = write_java_files(tmp_path, {name: 10 for name in "ABCD"})
+    backend = SlowBackend()
+    # 每分钟3000次，即相邻请求至少间隔0.02秒
+    engine = build_engine(backend, max_in_flight=4, requests_per_minute=3000, use_cache=False)
+    asyncio.run(engine.summarize_files(paths))
+    gaps = [b - a for a, b in zip(backend.start_times, backend.start_times[1:])]
+    assert len(gaps) == 3 and min(gaps) >= 0.019
+
+
+def test_rate_limiter_spaces_acquires():
+    async def acquire_times():
+        limiter = RateLimiter(6000)
+        loop = asyncio.get_running_loop()
+        times = []
+        for _ in range(4):
+            await limiter.acquire()
+            times.append(loop.time())
+        return times
+
+    times = asyncio.run(acquire_times())
+    assert times[-1] - times[0] >= 0.029
+
+
+def test_open_engine_closes_cache_it_opened(tmp_path, monkeypatch):
+    opened = []
+
+    class TrackingCache(SummaryCache):
+        def close(self):
+            opened.remove(self)
+            super().close()
+
+    def make_cache():
+        opened.append(TrackingCache(str(tmp_path / "cache.db")))
+        return opened[-1]
+
+    monkeypatch.setattr(summarize, "SummaryCache", make_cache)
+    with open_engine(SlowBackend()) as engine:
+        assert engine.cache is opened[0]
+    assert opened == []
+
+    cache = SummaryCache(str(tmp_path / "own.db"))
+    with open_engine(SlowBackend(), cache=cache):
+        pass
+    assert cache.get("blob", "template", "slow") is None
@@ -0,0 +1,28 @@
+import os
+import sqlite3
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
+
+from utils.summary_store import SummaryStore, read_summaries
+
+
+def test_read_summaries_does_not_modify_database(tmp_path):
+    db_path = str(tmp_path / "summary.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE summaries (path TEXT PRIMARY KEY, summary TEXT NOT NULL)")
+    conn.executemany("INSERT INTO summaries VALUES (?, ?)", [("b.java", "B"), ("a.java", "A")])
+    conn.commit()
+    conn.close()
+
+    assert list(read_summaries(db_path)) == [("a.java", "A"), ("b.java", "B")]
+    assert sqlite3.connect(db_path).execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+    assert not os.path.exists(db_path + "-wal")
+
+
+def test_read_summaries_from_summary_store(tmp_path):
+    db_path = str(tmp_path / "store.db")
+    store = SummaryStore(db_path)
+    store.add_many([("x.java", "X")])
+    store.close()
+    assert list(read_summaries(db_path)) == [("x.java", "X")]
@@ -1,20 +1,92 @@
+import io
 import os
+import re
+from typing import Callable, Iterator, List, Optional, TextIO
+
+from utils.tokens import estimate_file_tokens, estimate_tokens
 
 
 def read_and_replace_prompt(file_path: str, variables: dict) -> str:
     """
     从指定文件中读取文本，
     并将其中的{{var}}替换成对应的文本。
+    所有变量在一次扫描中替换，替换进来的文本（例如代码库全文）不会被再次扫描或复制。
     """
     with open(file_path, "r", encoding="utf-8") as file:
         prompt = file.read()
-    for key, value in variables.items():
-        prompt = prompt.replace(f"{{{{{key}}}}}", value)
-    return prompt
+    if not variables:
+        return prompt
+    pattern = re.compile("|".join(re.escape(f"{{{{{key}}}}}") for key in variables))
+    return pattern.sub(lambda match: variables[match.group(0)[2:-2]], prompt)
+
+
+def iter_code_files(root_path: str, filter: Callable[[str], bool]) -> Iterator[str]:
+    """
+    按路径的字典序递归遍历root_path，依次返回文件名通过filter的文件路径，结果与文件系统的遍历顺序无关。
+    """
+    for root, dirs, files in os.walk(root_path):
+        dirs.sort()
+        for file in sorted(files):
+            if filter(file):
+                yield os.path.join(root, file)
+
+
+def write_code_files(
+    out: TextIO, root_path: str, filter: Callable[[str], bool], use_relative_path: bool = False,
+    token_budget: Optional[int] = None
+) -> List[str]:
+    """
+    把代码文件的文件名和内容逐个写入out，同一时间只有一个文件的内容在内存中。
+    token_budget不为None时按文件大小估算token数，放不下的文件不读取、直接跳过，之后较小的文件仍可能写入。
+    返回因超出预算而被省略的文件路径列表。
+    """
+    omitted = []
+    remaining = token_budget
+    for file_path in iter_code_files(root_path, filter):
+        if use_relative_path:
+            file_display = os.path.relpath(file_path, root_path)
+        else:
+            file_display = os.path.basename(file_path)
+        header = f"文件名: {file_display}\n内容:\n"
+        if remaining is not None:
+            tokens = estimate_file_tokens(file_path) + estimate_tokens(header)
+            if tokens > remaining:
+                omitted.append(file_path)
+                continue
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                content = f.read()
+        except Exception as e:
+            print(f"无法读取文件: {file_path}, 原因: {e}")
+            continue
+        out.write(header)
+        out.write(content)
+        out.write("\n\n")
+        if remaining is not None:
+            remaining -= tokens
+    return omitted
+
+
+def write_omitted_files(
+    out: TextIO, omitted: List[str], root_path: str, use_relative_path: bool = False, token_budget: Optional[int] = None
+) -> None:
+    """
+    在拼接结果末尾列出因超出预算而省略的文件，让模型知道这些文件存在但没有给出内容，同时打印到控制台。
+    这段说明只包含文件名，不计入token预算。
+    """
+    if not omitted:
+        return
+    print(f"超出token预算{token_budget}，省略了{len(omitted)}个文件:")
+    out.write("以下文件因超出长度限制未包含内容:\n")
+    for file_path in omitted:
+        print(f"  {file_path}")
+        file_display = os.path.relpath(file_path, root_path) if use_relative_path else os.path.basename(file_path)
+        out.write(f"文件名: {file_display}\n")
+    out.write("\n")
 
 
 def concat_code_files(
-    root_path: str, filter: callable, use_relative_path: bool = False
+    root_path: str, filter: callable, use_relative_path: bool = False, token_budget: Optional[int] = None
 ) -> str:
     """
     递归遍历路径下所有文件夹中的代码文件，
@@ -24,26 +96,12 @@ def concat_code_files(
     root_path: 要遍历的根路径
     filter: 用于过滤文件的函数
     use_relative_path: 是否使用相对路径作为文件名，默认为False
+    token_budget: 估算的token数上限，默认为None即不限制，超出预算时在末尾列出被省略的文件
     """
-    result = ""
-
-    for root, dirs, files in os.walk(root_path):
-        for file in files:
-            file_path = os.path.join(root, file)
-            if filter(file):
-                try:
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        content = f.read()
-                        if use_relative_path:
-                            relative_path = os.path.relpath(file_path, root_path)
-                            file_display = relative_path
-                        else:
-                            file_display = file
-                        result += f"文件名: {file_display}\n内容:\n{content}\n\n"
-                except Exception as e:
-                    print(f"无法读取文件: {file_path}, 原因: {e}")
-
-    return result
+    buffer = io.StringIO()
+    omitted = write_code_files(buffer, root_path, filter, use_relative_path, token_budget)
+    write_omitted_files(buffer, omitted, root_path, use_relative_path, token_budget)
+    return buffer.getvalue()
 
 
 def read_commit(file: str) -> list:
@@ -65,6 +123,18 @@ def read_commit(file: str) -> list:
     return result
 
 
+def get_all_commits(data_folder="./data") -> list:
+    """
+    读取数据目录中全部文件的commit
+    返回一个列表，每个元素是一个元组(commit type, commit msg, commit hash, 文件名)
+    """
+    commits = []
+    for filename in os.listdir(data_folder):
+        for commit_type, commit_msg, commit_hash in read_commit(os.path.join(data_folder, filename)):
+            commits.append((commit_type, commit_msg, commit_hash, filename))
+    return commits
+
+
 def read_prompt(content: str) -> str:
     """
     返回prompt, 将{{content}}替换为传入的字符串
@@ -1,6 +1,7 @@
+import hashlib
 import subprocess
 import os
-from typing import Tuple
+from typing import Dict, List, Optional, Tuple, Union
 
 
 def checkout_to_parent_commit(project_root: str, commit_hash: str) -> Tuple[bool, str]:
@@ -47,3 +48,97 @@ def checkout_to_parent_commit(project_root: str, commit_hash: str) -> Tuple[bool
         return True, f"成功检出到父提交 {parent_hash}"
     except Exception as e:
         return False, f"发生错误: {str(e)}"
+
+
+def get_head_commit(project_root: str) -> Optional[str]:
+    """
+    获取Git仓库当前检出的提交哈希值。
+
+    参数:
+        project_root (str): 项目根目录的路径
+
+    返回:
+        Optional[str]: 当前HEAD的提交哈希，失败时返回None
+    """
+    cmd = ["git", "-C", project_root, "rev-parse", "HEAD"]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    return result.stdout.strip()
+
+
+def diff_name_status(
+    project_root: str, base_commit: str, target_commit: str = "HEAD"
+) -> Tuple[bool, Union[List[Tuple[str, str, Optional[str]]], str]]:
+    """
+    获取两个提交之间发生变化的文件（`git diff --name-status`）。
+
+    参数:
+        project_root (str): 项目根目录的路径
+        base_commit (str): 起始提交
+        target_commit (str): 目标提交，默认为HEAD
+
+    返回:
+        Tuple[bool, Union[List, str]]: (成功标志, 变更列表或错误信息)
+        变更列表的每个元素为(状态, 路径, 新路径)，状态取A/M/D/R/C/T等首字母，
+        仅重命名(R)和复制(C)的新路径不为None，路径均为相对于project_root、以"/"分隔的路径
+    """
+    cmd = ["git", "-C", project_root, "diff", "--name-status", "--relative", "-M", "-z", base_commit, target_commit]
+    result = subprocess.run(cmd, capture_output=True, text=True, encoding="utf-8")
+    if result.returncode != 0:
+        return False, f"无法比较提交 {base_commit} 与 {target_commit}: {result.stderr.strip()}"
+
+    changes = []
+    fields = result.stdout.split("\0")
+    i = 0
+    while i < len(fields) and fields[i]:
+        status = fields[i][0]
+        if status in ("R", "C"):
+            changes.append((status, fields[i + 1], fields[i + 2]))
+            i += 3
+        else:
+            changes.append((status, fields[i + 1], None))
+            i += 2
+    return True, changes
+
+
+def git_blob_hash(content: bytes) -> str:
+    """
+    计算内容对应的Git blob哈希值，结果与`git hash-object`一致。
+
+    参数:
+        content (bytes): 文件的原始字节内容
+
+    返回:
+        str: 40位十六进制的SHA-1哈希
+    """
+    header = f"blob {len(content)}\0".encode("ascii")
+    return hashlib.sha1(header + content).hexdigest()
+
+
+def ls_tree_blobs(project_root: str, commit: str = "HEAD") -> Tuple[bool, Union[Dict[str, str], str]]:
+    """
+    获取指定提交中每个文件的blob哈希（`git ls-tree -r`）。
+
+    参数:
+        project_root (str): 项目根目录的路径
+        commit (str): 提交，默认为HEAD
+
+    返回:
+        Tuple[bool, Union[Dict[str, str], str]]: (成功标志, {路径: blob哈希}或错误信息)
+        路径为相对于project_root、以"/"分隔的路径，只包含project_root下的文件
+    """
+    cmd = ["git", "-C", project_root, "ls-tree", "-r", "-z", commit]
+    result = subprocess.run(cmd, capture_output=True, text=True, encoding="utf-8")
+    if result.returncode != 0:
+        return False, f"无法列出提交 {commit} 中的文件: {result.stderr.strip()}"
+
+    blobs = {}
+    for entry in result.stdout.split("\0"):
+        if not entry:
+            continue
+        info, path = entry.split("\t", 1)
+        _, object_type, object_hash = info.split()
+        if object_type == "blob":
+            blobs[path] = object_hash
+    return True, blobs
@@ -0,0 +1,288 @@
+"""
+Java源码的轻量处理工具。
+"""
+import threading
+from collections import OrderedDict, namedtuple
+from typing import List, Optional
+
+import javalang
+
+from utils.git import git_blob_hash
+
+# 方法（含构造函数）的位置信息，行号从1开始，end_line为方法体右花括号所在行
+JavaMethod = namedtuple("JavaMethod", ["name", "class_name", "signature", "start_line", "end_line"])
+# 检索用的源码块，行号从1开始且包含两端；不属于任何方法的块（类声明、字段等）method_name为None
+JavaChunk = namedtuple("JavaChunk", ["text", "class_name", "method_name", "start_line", "end_line"])
+
+_TYPE_KEYWORDS = ("class", "interface", "enum")
+_METHOD_CACHE_SIZE = 4096
+_method_cache = OrderedDict()
+_method_cache_lock = threading.Lock()
+
+
+def _find_closing(tokens, index, open_value, close_value) -> int:
+    """
+    返回与tokens[index]（开括号）匹配的闭括号下标，找不到时返回最后一个token的下标。
+    """
+    depth = 0
+    for i in range(index, len(tokens)):
+        value = tokens[i].value
+        if value == open_value:
+            depth += 1
+        elif value == close_value:
+            depth -= 1
+            if depth == 0:
+                return i
+    return len(tokens) - 1
+
+
+def _is_method_name(tokens, index, decl_start, type_name) -> bool:
+    """
+    判断类体中的标识符tokens[index]（后面紧跟左括号）是否为方法或构造函数的名字。
+    """
+    prev = tokens[index - 1] if index > decl_start else None
+    # 字段初始化表达式中的方法调用；注解参数（如@GetMapping(value = "/list")）中的等号在括号内，不算在内
+    depth = 0
+    for token in tokens[decl_start:index]:
+        if token.value == "(":
+            depth += 1
+        elif token.value == ")":
+            depth -= 1
+        elif token.value == "=" and depth == 0:
+            return False
+    # 源码片段中无法得知外层类名，此时类型名为空字符串，任何名字都可能是构造函数
+    is_constructor_name = tokens[index].value == type_name or type_name == ""
+    if prev is None:
+        return is_constructor_name
+    if isinstance(prev, (javalang.tokenizer.Identifier, javalang.tokenizer.BasicType)):
+        return True
+    if prev.value in ("void", ">", "]"):
+        return True
+    # 构造函数前面是修饰符或注解参数的右括号
+    return is_constructor_name and (isinstance(prev, javalang.tokenizer.Modifier) or prev.value == ")")
+
+
+def _parse_methods(content: str, fragment: bool) -> List[JavaMethod]:
+    tokens = list(javalang.tokenizer.tokenize(content))
+    line_offsets = [0]
+    for i, c in enumerate(content):
+        if c == "\n":
+            line_offsets.append(i + 1)
+
+    def offset(token):
+        return line_offsets[token.position.line - 1] + token.position.column - 1
+
+    methods = []
+    # 每个未闭合的左花括号对应一项：类型体时为类型名，否则为None
+    # 片段模式下假设最外层就是某个类型体
+    brace_stack = [""] if fragment else []
+    pending_type = None
+    decl_start = 0
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        value = token.value
+        type_name = brace_stack[-1] if brace_stack else None
+
+        if isinstance(token, javalang.tokenizer.Keyword) and value in _TYPE_KEYWORDS:
+            # 排除 Foo.class 这样的类字面量
+            if (i == 0 or tokens[i - 1].value != ".") and i + 1 < len(tokens):
+                pending_type = tokens[i + 1].value
+        elif isinstance(token, javalang.tokenizer.Separator) and value == "{":
+            brace_stack.append(pending_type)
+            pending_type = None
+            decl_start = i + 1
+        elif isinstance(token, javalang.tokenizer.Separator) and value == "}":
+            if brace_stack:
+                brace_stack.pop()
+            decl_start = i + 1
+        elif isinstance(token, javalang.tokenizer.Separator) and value == ";":
+            decl_start = i + 1
+        elif (type_name is not None and pending_type is None and isinstance(token, javalang.tokenizer.Identifier)
+              and i + 1 < len(tokens) and tokens[i + 1].value == "("
+              and _is_method_name(tokens, i, decl_start, type_name)):
+            close_paren = _find_closing(tokens, i + 1, "(", ")")
+            body = close_paren + 1
+            while body < len(tokens) and tokens[body].value not in ("{", ";"):
+                body += 1
+            if body >= len(tokens):
+                break
+            end = _find_closing(tokens, body, "{", "}") if tokens[body].value == "{" else body
+            start_token = tokens[decl_start]
+            signature = " ".join(content[offset(start_token):offset(tokens[body])].split())
+            methods.append(JavaMethod(value, type_name, signature, start_token.position.line,
+                                      tokens[end].position.line))
+            i = end + 1
+            decl_start = i
+            continue
+        i += 1
+    return methods
+
+
+def extract_methods(content: str, blob_hash: Optional[str] = None, fragment: bool = False) -> List[JavaMethod]:
+    """
+    基于javalang词法分析，一次线性扫描提取类体中声明的方法和构造函数（不含方法体内的局部类、匿名类）。
+    fragment为True时content是从类体中截取的片段（例如大文件的分段），最外层按类体处理，类名为空字符串。
+    结果按文件的blob哈希缓存，摘要提示词、源码切分等后续步骤可以重复使用。
+    词法分析失败时抛出javalang.tokenizer.LexerError。
+    """
+    if blob_hash is None:
+        blob_hash = git_blob_hash(content.encode("utf-8"))
+    key = (blob_hash, fragment)
+    with _method_cache_lock:
+        if key in _method_cache:
+            _method_cache.move_to_end(key)
+            return _method_cache[key]
+
+    methods = _parse_methods(content, fragment)
+    with _method_cache_lock:
+        _method_cache[key] = methods
+        if len(_method_cache) > _METHOD_CACHE_SIZE:
+            _method_cache.popitem(last=False)
+    return methods
+
+
+def _member_boundaries(content: str) -> List[int]:
+    """
+    线性扫描源码，返回类成员结束位置（回到类体层级的右花括号之后）的字符下标。
+    字符串、字符字面量和注释中的花括号会被忽略。
+    """
+    boundaries = []
+    depth = 0
+    i, n = 0, len(content)
+    while i < n:
+        c = content[i]
+        if c == "/" and i + 1 < n and content[i + 1] == "/":
+            end = content.find("\n", i)
+            i = n if end == -1 else end
+            continue
+        if c == "/" and i + 1 < n and content[i + 1] == "*":
+            end = content.find("*/", i + 2)
+            i = n if end == -1 else end + 2
+            continue
+        if c == '"' or c == "'":
+            if content.startswith('"""', i):
+                end = content.find('"""', i + 3)
+                i = n if end == -1 else end + 3
+                continue
+            i += 1
+            while i < n and content[i] != c and content[i] != "\n":
+                i += 2 if content[i] == "\\" else 1
+            i += 1
+            continue
+        if c == "{":
+            depth += 1
+        elif c == "}":
+            depth -= 1
+            if depth <= 1:
+                boundaries.append(i + 1)
+        i += 1
+    return boundaries
+
+
+def split_java_source(content: str, max_chars: int) -> List[str]:
+    """
+    在方法（类成员）边界处把源码切分为不超过max_chars的若干段。
+    单个成员本身超过max_chars时，再按行切分。
+    """
+    if len(content) <= max_chars:
+        return [content]
+
+    # 优先使用extract_methods给出的方法结束行作为切分点，词法分析失败时退回花括号扫描
+    try:
+        line_ends = [i + 1 for i, c in enumerate(content) if c == "\n"]
+        cuts = [line_ends[method.end_line - 1] if method.end_line <= len(line_ends) else len(content)
+                for method in extract_methods(content)]
+    except javalang.tokenizer.LexerError:
+        # 把边界对齐到行尾，避免把右花括号后的注释或空白切到下一段开头
+        cuts = []
+        for pos in _member_boundaries(content):
+            line_end = content.find("\n", pos)
+            cuts.append(len(content) if line_end == -1 else line_end + 1)
+    cuts.append(len(content))
+
+    segments, start = [], 0
+    for cut in cuts:
+        if cut > start:
+            segments.append(content[start:cut])
+            start = cut
+
+    chunks, current = [], ""
+    for segment in segments:
+        if len(segment) > max_chars:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.extend(_split_lines(segment, max_chars))
+        elif len(current) + len(segment) > max_chars:
+            chunks.append(current)
+            current = segment
+        else:
+            current += segment
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _split_lines(text: str, max_chars: int) -> List[str]:
+    chunks, current = [], ""
+    for line in text.splitlines(keepends=True):
+        if current and len(current) + len(line) > max_chars:
+            chunks.append(current)
+            current = ""
+        current += line
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def chunk_java_source(content: str, max_chars: int = 4000) -> List[JavaChunk]:
+    """
+    按方法边界把源码切成检索用的块：每个方法一块，包含它前面的注释、注解和字段声明；
+    第一个方法之前的package、import和类声明单独成块。超过max_chars的块再按行切分。
+    词法分析失败时退回split_java_source，块中没有类名和方法名。
+    """
+    lines = content.splitlines(keepends=True)
+    try:
+        methods = extract_methods(content)
+    except javalang.tokenizer.LexerError:
+        chunks, line = [], 1
+        for text in split_java_source(content, max_chars):
+            end = line + text.count("\n") - (1 if text.endswith("\n") else 0)
+            chunks.append(JavaChunk(text, None, None, line, end))
+            line = end + 1
+        return chunks
+
+    spans = []
+    previous_end = 0
+    for method in methods:
+        if method.end_line <= previous_end:
+            continue
+        if not spans and method.start_line > 1:
+            # 第一个方法前面紧挨着的注释和注解归入方法块
+            header_end = method.start_line - 1
+            while header_end > 0 and (not lines[header_end - 1].strip()
+                                      or lines[header_end - 1].lstrip().startswith(("/*", "*", "//", "@"))):
+                header_end -= 1
+            if header_end > 0:
+                spans.append((1, header_end, method.class_name, None))
+            previous_end = header_end
+        spans.append((previous_end + 1, method.end_line, method.class_name, method.name))
+        previous_end = method.end_line
+    if not spans:
+        spans.append((1, len(lines), None, None))
+    elif previous_end < len(lines) and "".join(lines[previous_end:]).strip(" \t\r\n}"):
+        # 最后一个方法之后除了右花括号还有其他内容，例如末尾的字段或内部类
+        spans.append((previous_end + 1, len(lines), spans[-1][2], None))
+
+    chunks = []
+    for start, end, class_name, method_name in spans:
+        text = "".join(lines[start - 1:end])
+        if not text.strip():
+            continue
+        line = start
+        for piece in _split_lines(text, max_chars):
+            piece_end = line + piece.count("\n") - (1 if piece.endswith("\n") else 0)
+            chunks.append(JavaChunk(piece, class_name, method_name, line, piece_end))
+            line = piece_end + 1
+    return chunks
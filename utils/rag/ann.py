@@ -0,0 +1,219 @@
+"""
+近似最近邻(ANN)索引的构建、检索参数设置，以及与精确检索对比的召回率/延迟报告。
+
+支持的索引类型：
+    flat     精确检索
+    ivf_flat 倒排 + 原始向量，参数nlist，检索参数nprobe
+    ivf_pq   倒排 + 乘积量化，参数nlist、pq_m、pq_nbits，检索参数nprobe
+    hnsw     分层小世界图，参数hnsw_m、ef_construction，检索参数ef_search
+    sq_fp16  向量按float16保存，内存减半
+    pq       乘积量化编码，参数pq_m、pq_nbits，每个向量只占pq_m*pq_nbits/8字节
+
+rerank为True时在压缩索引外再保存一份float32原始向量，先用压缩索引取出k*k_factor个候选，
+再按精确距离重排。以内存映射方式加载时原始向量留在页缓存中，只有被访问的候选才会读入。
+"""
+import math
+import time
+from typing import Dict, List, Optional, Sequence
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw", "sq_fp16", "pq")
+
+
+def default_nlist(count: int) -> int:
+    # 经验值：约4*sqrt(n)个聚类中心，且每个中心至少有39个训练向量
+    return max(1, min(int(4 * math.sqrt(count)), count // 39))
+
+
+def build_faiss_index(vectors: np.ndarray, index_type: str = "flat", nlist: Optional[int] = None,
+                      pq_m: int = 16, pq_nbits: int = 8, hnsw_m: int = 32, ef_construction: int = 40,
+                      rerank: bool = False) -> faiss.Index:
+    """
+    创建index_type类型的空索引，需要训练的类型用vectors训练。返回的索引还没有加入任何向量。
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type}, expected one of {INDEX_TYPES}")
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    dim = vectors.shape[1]
+    if index_type in ("ivf_pq", "pq") and dim % pq_m != 0:
+        raise ValueError(f"pq_m={pq_m} must divide the vector dimension {dim}")
+
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m)
+        index.hnsw.efConstruction = ef_construction
+    elif index_type == "sq_fp16":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16)
+    elif index_type == "pq":
+        index = faiss.IndexPQ(dim, pq_m, pq_nbits)
+        index.train(vectors)
+    else:
+        nlist = nlist or default_nlist(len(vectors))
+        quantizer = faiss.IndexFlatL2(dim)
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, pq_nbits)
+        index.train(vectors)
+        # IndexIVF不持有quantizer的所有权，需要保留引用避免被回收
+        index.quantizer_ref = quantizer
+
+    if rerank and index_type != "flat":
+        base = index
+        index = faiss.IndexRefineFlat(base)
+        index.base_ref = base
+    return index
+
+
+def _base_index(index: faiss.Index) -> faiss.Index:
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexRefine):
+        return faiss.downcast_index(index.base_index)
+    return index
+
+
+def set_search_params(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                      k_factor: Optional[float] = None) -> None:
+    """
+    设置检索参数，与索引类型无关的参数会被忽略。k_factor为重排时候选数相对k的倍数。
+    """
+    if nprobe is not None:
+        try:
+            faiss.extract_index_ivf(index).nprobe = nprobe
+        except RuntimeError:
+            pass
+    if ef_search is not None:
+        base = _base_index(index)
+        if hasattr(base, "hnsw"):
+            base.hnsw.efSearch = ef_search
+    if k_factor is not None:
+        refine = faiss.downcast_index(index)
+        if isinstance(refine, faiss.IndexRefine):
+            refine.k_factor = k_factor
+
+
+def get_search_params(index: faiss.Index) -> Dict:
+    """
+    读取当前的检索参数，返回值可以直接传给set_search_params。
+    """
+    params = {}
+    try:
+        params["nprobe"] = faiss.extract_index_ivf(index).nprobe
+    except RuntimeError:
+        pass
+    base = _base_index(index)
+    if hasattr(base, "hnsw"):
+        params["ef_search"] = base.hnsw.efSearch
+    refine = faiss.downcast_index(index)
+    if isinstance(refine, faiss.IndexRefine):
+        params["k_factor"] = refine.k_factor
+    return params
+
+
+def reconstruct_vectors(index: faiss.Index, positions: np.ndarray) -> np.ndarray:
+    """
+    按向量下标取回索引中保存的向量，量化索引返回的是解码后的近似向量。
+    """
+    try:
+        return index.reconstruct_batch(positions)
+    except RuntimeError:
+        # IVF索引需要先建立向量下标到倒排表位置的映射才能取回向量
+        faiss.extract_index_ivf(index).make_direct_map()
+        return index.reconstruct_batch(positions)
+
+
+def selector_search_params(index: faiss.Index, selector: faiss.IDSelector) -> Optional[faiss.SearchParameters]:
+    """
+    生成只在selector选中的向量中检索的参数，保留索引当前的nprobe、efSearch和k_factor。
+    索引类型不支持按id过滤（例如IndexPQ）时返回None，调用方需要多取一些结果再自行过滤。
+    """
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexRefine):
+        base_params = selector_search_params(index.base_index, selector)
+        if base_params is None:
+            return None
+        params = faiss.IndexRefineSearchParameters(k_factor=index.k_factor, base_index_params=base_params)
+        params.base_ref = base_params
+        return params
+    if isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe)
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    if isinstance(index, (faiss.IndexFlat, faiss.IndexScalarQuantizer)):
+        return faiss.SearchParameters(sel=selector)
+    return None
+
+
+def removes_contiguously(index: faiss.Index) -> bool:
+    """
+    判断remove_ids之后剩余向量是否重新编号为0..n-1。Flat、SQ、PQ索引会前移剩余向量；
+    IVF索引保留原id，HNSW和带重排的索引不支持remove_ids，这些索引删除时需要重建。
+    """
+    return isinstance(faiss.downcast_index(index), (faiss.IndexFlat, faiss.IndexScalarQuantizer, faiss.IndexPQ))
+
+
+def _bytes_per_vector(index: faiss.Index) -> float:
+    return faiss.serialize_index(index).nbytes / max(index.ntotal, 1)
+
+
+def _timed_search(index: faiss.Index, queries: np.ndarray, k: int):
+    start = time.perf_counter()
+    _, ids = index.search(queries, k)
+    return ids, (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def recall_report(vectors: np.ndarray, queries: np.ndarray, k: int = 10,
+                  configs: Optional[Sequence[Dict]] = None) -> List[Dict]:
+    """
+    用vectors分别建立configs中的索引，以精确检索的结果为基准，统计每种配置的recall@k、平均每个查询的耗时(毫秒)
+    和平均每个向量占用的索引字节数。
+    configs的每一项是build_faiss_index和set_search_params的参数，例如{"index_type": "ivf_flat", "nprobe": 8}。
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    if configs is None:
+        configs = [{"index_type": "ivf_flat", "nprobe": nprobe} for nprobe in (1, 4, 16, 64)]
+        configs += [{"index_type": "ivf_pq", "nprobe": nprobe} for nprobe in (4, 16, 64)
+                    if vectors.shape[1] % 16 == 0]
+        configs += [{"index_type": "hnsw", "ef_search": ef} for ef in (16, 64, 256)]
+        configs += [{"index_type": "sq_fp16"}]
+        if vectors.shape[1] % 16 == 0:
+            configs += [{"index_type": "pq"}] + [{"index_type": "pq", "rerank": True, "k_factor": factor}
+                                                 for factor in (2, 8)]
+
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    truth, exact_ms = _timed_search(exact, queries, k)
+    rows = [{"config": "flat", "recall": 1.0, "ms_per_query": exact_ms, "bytes_per_vector": _bytes_per_vector(exact)}]
+
+    built = {}
+    for config in configs:
+        config = dict(config)
+        nprobe = config.pop("nprobe", None)
+        ef_search = config.pop("ef_search", None)
+        k_factor = config.pop("k_factor", None)
+        key = tuple(sorted(config.items()))
+        if key not in built:
+            index = build_faiss_index(vectors, **config)
+            index.add(vectors)
+            built[key] = index
+        index = built[key]
+        set_search_params(index, nprobe, ef_search, k_factor)
+        ids, ms = _timed_search(index, queries, k)
+        hits = sum(len(set(row) & set(expected)) for row, expected in zip(ids, truth))
+        search_params = [("nprobe", nprobe), ("ef_search", ef_search), ("k_factor", k_factor)]
+        params = ", ".join(f"{name}={value}" for name, value in list(config.items()) + search_params
+                           if value is not None)
+        rows.append({"config": params, "recall": hits / truth.size, "ms_per_query": ms,
+                     "bytes_per_vector": _bytes_per_vector(index)})
+    return rows
+
+
+def print_recall_report(rows: List[Dict], k: int = 10) -> None:
+    print(f"{'config':<56}{f'recall@{k}':>12}{'ms/query':>12}{'bytes/vec':>12}")
+    for row in rows:
+        print(f"{row['config']:<56}{row['recall']:>12.3f}{row['ms_per_query']:>12.4f}"
+              f"{row['bytes_per_vector']:>12.1f}")
@@ -1,4 +1,5 @@
 import pathlib
+import threading
 from os import path
 
 from .rag_system import RAGSystem
@@ -16,4 +17,18 @@ template = """
 """
 
 
-_rag_system_hpv = RAGSystem.load_index(rag_binary, template)
+_rag_system_hpv = None
+_rag_system_lock = threading.Lock()
+
+
+def get_rag_system() -> RAGSystem:
+    """
+    首次调用时加载index.bin并创建向量模型和LLM客户端，之后返回同一个实例。
+    导入本模块不会读取索引，也不需要API key。
+    """
+    global _rag_system_hpv
+    if _rag_system_hpv is None:
+        with _rag_system_lock:
+            if _rag_system_hpv is None:
+                _rag_system_hpv = RAGSystem.load_index(str(rag_binary), template)
+    return _rag_system_hpv
@@ -1,20 +1,30 @@
+import hashlib
+import importlib.metadata
+import os
 import pathlib
 from abc import abstractmethod
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from re import split
-from typing import List
+from typing import Iterable, Iterator, List
 
 import pandas as pd
-import pymupdf4llm
 from langchain.docstore.document import Document
 from langchain_text_splitters import CharacterTextSplitter
 
+from utils.java_source import chunk_java_source
+from utils.summary_store import connect_read_only
+
 
 class BaseStrategy:
     def __init__(self, path):
         self.path: pathlib.Path = path
 
     @abstractmethod
-    def process(self, **kwargs) -> List[Document]:
+    def process(self, **kwargs) -> Iterable[Document]:
+        """
+        返回数据源中的文档，可以是列表，也可以是逐个产生文档的迭代器。
+        """
         ...
 
     def split_text(self, text: str, file_name = "") -> List[Document]:
@@ -27,55 +37,161 @@ class BaseStrategy:
 
 
 class ExcelStrategy(BaseStrategy):
-    def __init__(self, path: pathlib.Path, content_column, source_column="", link_column="", sheet_name="Sheet1"):
+    def __init__(self, path: pathlib.Path, content_column, source_column="", link_column="", sheet_name="Sheet1",
+                 blobs=None):
         super().__init__(path)
         self.content_column: str = content_column
         self.source_column: str = source_column
         self.link_column: str = link_column
         self.sheet_name: str = sheet_name
+        self.blobs = blobs
 
-    def process(self, **kwargs) -> List[Document]:
+    def process(self, **kwargs) -> Iterator[Document]:
         print(f"Processing: {self.path}")
         df = pd.read_excel(self.path, sheet_name=self.sheet_name)
-        documents = []
-        for idx, row in df.iterrows():
-            combined_content = f"{row[self.content_column]}"
-            if len(combined_content) < 5:
-                continue
-            if self.source_column:
-                combined_content = combined_content + f"\n Source: {row[self.source_column]}"
-            if self.link_column:
-                combined_content = combined_content + f"URL: {row[self.link_column]}"
-            documents.append(Document(page_content=combined_content))
-        return documents
+        # 按列拼接字符串，避免逐行iterrows
+        contents = df[self.content_column].astype(str)
+        keep = contents.str.len() >= 5
+        combined = contents
+        sources = None
+        if self.source_column:
+            sources = df[self.source_column].astype(str)
+            combined = combined + "\n Source: " + sources
+        if self.link_column:
+            combined = combined + "URL: " + df[self.link_column].astype(str)
+        # 文档在取用时才逐个创建
+        if sources is None:
+            return (Document(page_content=content) for content in combined[keep])
+        return (Document(page_content=content, metadata=_source_metadata(source, self.blobs))
+                for content, source in zip(combined[keep], sources[keep]))
+
+
+def _source_metadata(source, blobs) -> dict:
+    # blobs为{文件路径: blob哈希}时同时记录文件版本，见RAGSystem.set_visible_versions
+    if blobs is None:
+        return {"source": source}
+    return {"source": source, "blob": blobs.get(source)}
+
+
+class SQLiteStrategy(BaseStrategy):
+    """
+    读取SQLite摘要库(utils.summary_store.SummaryStore)，默认表和列与SummaryStore一致。
+    """
+
+    def __init__(self, path: pathlib.Path, table="summaries", content_column="summary", source_column="path",
+                 blobs=None):
+        super().__init__(path)
+        self.table: str = table
+        self.content_column: str = content_column
+        self.source_column: str = source_column
+        self.blobs = blobs
+
+    def process(self, **kwargs) -> Iterator[Document]:
+        """
+        以只读方式打开数据库，从游标中逐行产生文档，不会一次读入整张表。
+        """
+        print(f"Processing: {self.path}")
+        columns = f'"{self.content_column}"' + (f', "{self.source_column}"' if self.source_column else "")
+        conn = connect_read_only(self.path)
+        try:
+            for row in conn.execute(f'SELECT {columns} FROM "{self.table}"'):
+                if len(row[0]) < 5:
+                    continue
+                if not self.source_column:
+                    yield Document(page_content=row[0])
+                else:
+                    content, source = row
+                    yield Document(page_content=f"{content}\n Source: {source}",
+                                   metadata=_source_metadata(source, self.blobs))
+        finally:
+            conn.close()
 
 
 def save_markdown_to_file(md_text: str, file_path: str):
-    with open(file_path, "w+") as f:
+    # 先写临时文件再改名，并行转换时其他进程不会读到写了一半的缓存
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
         f.write(md_text)
+    os.replace(tmp_path, file_path)
+
+
+def _converter_version() -> str:
+    try:
+        return importlib.metadata.version("pymupdf4llm")
+    except importlib.metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def _file_hash(path: pathlib.Path) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
 
 class PDFStrategy(BaseStrategy):
-    def __init__(self,path, use_cache=True):
+    """
+    用pymupdf4llm把PDF转换为Markdown后切分。
+
+    转换结果缓存在cache_dir中，文件名由PDF内容哈希和转换器版本决定，
+    PDF内容变化或升级pymupdf4llm后会重新转换，不同目录下的同名PDF也不会互相覆盖。
+    多个PDF由RAGContentProvider.iter_documents在进程池中并行转换。
+    """
+
+    def __init__(self, path, use_cache=True, cache_dir=None):
         super().__init__(path)
         self.use_cache = use_cache
+        self.cache_dir = pathlib.Path(cache_dir) if cache_dir is not None else self.path.parent / "cache"
+
+    def cache_path(self) -> pathlib.Path:
+        return self.cache_dir / f"{_file_hash(self.path)}-{_converter_version()}.md"
 
     def process(self, **kwargs) -> List[Document]:
-        if self.use_cache:
-            if (self.path.parent.parent / "cache" / (self.path.stem + ".md")).exists():
-                print(f"Using cache for {self.path}")
-                md_text = read_file(self.path.parent.parent / "cache" / (self.path.stem + ".md"))
-                return self.split_text(md_text)
-            else:
-                print(f"Processing: {self.path}")
-                md_text = pymupdf4llm.to_markdown(self.path)
-                save_markdown_to_file(md_text, str(self.path.parent.parent / "cache" / (self.path.stem + ".md")))
-
-                return self.split_text(md_text, self.path.stem)
-        else:
+        if not self.use_cache:
             print(f"Processing: {self.path}")
-            md_text = pymupdf4llm.to_markdown(self.path)
+            return self.split_text(self._convert(), self.path.stem)
 
-            return self.split_text(md_text)
+        cache_path = self.cache_path()
+        if cache_path.exists():
+            print(f"Using cache for {self.path}")
+            return self.split_text(read_file(cache_path), self.path.stem)
+        print(f"Processing: {self.path}")
+        md_text = self._convert()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        save_markdown_to_file(md_text, str(cache_path))
+        return self.split_text(md_text, self.path.stem)
+
+    def _convert(self) -> str:
+        # pymupdf4llm导入较慢，只在确实需要转换时导入
+        import pymupdf4llm
+        return pymupdf4llm.to_markdown(str(self.path))
+
+
+class JavaSourceStrategy(BaseStrategy):
+    """
+    按类和方法边界切分Java源文件，每块的metadata包含source（文件路径）、class、method、start_line和end_line，
+    检索到之后可以只读取对应的行。
+    """
+
+    def __init__(self, path: pathlib.Path, source: str = None, max_chars: int = 4000):
+        super().__init__(path)
+        self.source: str = source if source is not None else str(path)
+        self.max_chars: int = max_chars
+
+    def process(self, **kwargs) -> List[Document]:
+        print(f"Processing: {self.path}")
+        documents = []
+        for chunk in chunk_java_source(read_file(self.path), self.max_chars):
+            location = f"{self.source}#L{chunk.start_line}-L{chunk.end_line}"
+            documents.append(Document(page_content=f"{chunk.text}\n Source: {location}", metadata={
+                "source": self.source,
+                "class": chunk.class_name,
+                "method": chunk.method_name,
+                "start_line": chunk.start_line,
+                "end_line": chunk.end_line,
+            }))
+        return documents
 
 
 class RawFileStrategy(BaseStrategy):
@@ -85,10 +201,15 @@ class RawFileStrategy(BaseStrategy):
 
 
 def read_file(path):
-    with open(path, 'r') as f:
+    with open(path, 'r', encoding="utf-8") as f:
         return f.read()
 
 
+def _process_source(source: BaseStrategy) -> List[Document]:
+    # 在子进程中执行，需要是模块级函数才能被pickle，结果整体传回主进程
+    return list(source.process())
+
+
 class RAGContentProvider:
 
     def __init__(self, root_dir, pdf_output_dir="cache"):
@@ -107,24 +228,83 @@ class RAGContentProvider:
         for file_path in input_path.glob(suffix):
             self.sources.append(RawFileStrategy(file_path))
 
-    def add_excel_file(self, path: str, content_column, source_column="", link_column="", sheet_name="Sheet1"):
-        self.sources.append(ExcelStrategy(self.root_dir / path, content_column, source_column, link_column, sheet_name))
+    def add_excel_file(self, path: str, content_column, source_column="", link_column="", sheet_name="Sheet1",
+                       blobs=None):
+        self.sources.append(ExcelStrategy(self.root_dir / path, content_column, source_column, link_column, sheet_name,
+                                          blobs))
 
     def add_excel_file_folder(self, path: str, content_column, source_column="", link_column="", sheet_name="Sheet1"):
         input_path = self.root_dir / path
         for excel_path in input_path.glob("*.xlsx"):
             self.sources.append(ExcelStrategy(excel_path, content_column, source_column, link_column, sheet_name))
 
+    def add_sqlite_file(self, path: str, table="summaries", content_column="summary", source_column="path",
+                        blobs=None):
+        self.sources.append(SQLiteStrategy(self.root_dir / path, table, content_column, source_column, blobs))
+
+    def add_java_source_folder(self, path: str, max_chars: int = 4000):
+        """
+        递归添加目录下的所有Java源文件，metadata中的source为相对于root_dir的路径。
+        """
+        input_path = self.root_dir / path
+        for java_path in sorted(input_path.rglob("*.java")):
+            source = java_path.relative_to(self.root_dir).as_posix()
+            self.sources.append(JavaSourceStrategy(java_path, source, max_chars))
+
     def add_pdf_file(self, path: str):
-        self.sources.append(PDFStrategy(self.root_dir / path))
+        self.sources.append(PDFStrategy(self.root_dir / path, cache_dir=self.pdf_output_dir))
 
     def add_pdf_file_folder(self, path: str):
         input_path = pathlib.Path(self.root_dir / path)
         for pdf_path in input_path.glob("*.pdf"):
-            self.sources.append(PDFStrategy(pdf_path))
+            self.sources.append(PDFStrategy(pdf_path, cache_dir=self.pdf_output_dir))
+
+    def iter_documents(self, batch_size: int = 256, max_workers: int = None) -> Iterator[List[Document]]:
+        """
+        按添加顺序逐批返回文档，每批最多batch_size个。
+        多个数据源时在进程池中并行处理，同时处理中的数据源不超过max_workers的两倍，已经返回的批次不会继续占用内存。
+        只有一个数据源时在当前进程中处理，SQLite摘要库等按行产生文档的数据源边读边返回批次。
+        """
+        max_workers = max_workers or os.cpu_count() or 1
+        if len(self.sources) <= 1 or max_workers == 1:
+            results = (source.process() for source in self.sources)
+            yield from _batched(results, batch_size)
+            return
+
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            sources = iter(self.sources)
+            pending = deque()
+
+            def submit_next():
+                source = next(sources, None)
+                if source is not None:
+                    pending.append(executor.submit(_process_source, source))
+
+            for _ in range(max_workers * 2):
+                submit_next()
+
+            def results():
+                while pending:
+                    documents = pending.popleft().result()
+                    submit_next()
+                    yield documents
+
+            yield from _batched(results(), batch_size)
 
     def get_documents(self):
         documents = []
-        for source in self.sources:
-            documents.extend(source.process())
+        for batch in self.iter_documents():
+            documents.extend(batch)
         return documents
+
+
+def _batched(results, batch_size: int) -> Iterator[List[Document]]:
+    batch = []
+    for documents in results:
+        for document in documents:
+            batch.append(document)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
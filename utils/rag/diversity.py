@@ -0,0 +1,52 @@
+"""
+检索结果的多样化：按最大边际相关(MMR)重排，并限制同一来源文件的文档数，让每个检索位置都带来新的信息。
+"""
+from typing import Hashable, List, Optional, Sequence
+
+import numpy as np
+
+
+def mmr_select(relevance: Sequence[float], k: int, vectors: Optional[np.ndarray] = None, lambda_mult: float = 0.5,
+               groups: Optional[Sequence[Optional[Hashable]]] = None, max_per_group: Optional[int] = None
+               ) -> List[int]:
+    """
+    从候选中依次选出k个，返回候选下标。每一步选择lambda_mult*相关度 - (1-lambda_mult)*与已选结果的最大余弦相似度
+    最高的候选，相关度先除以最大值归一化。vectors为None时只按相关度排序。
+    groups为每个候选所属的分组（通常是来源文件），同一分组最多选max_per_group个，分组为None的候选不受限制。
+    候选不足时返回的结果少于k个。
+    """
+    relevance = np.asarray(relevance, dtype=np.float64)
+    n = len(relevance)
+    if n == 0 or k <= 0:
+        return []
+    if relevance.max() > 0:
+        relevance = relevance / relevance.max()
+
+    similarity = None
+    if vectors is not None:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        unit = vectors / np.where(norms == 0, 1, norms)
+        similarity = unit @ unit.T
+    else:
+        lambda_mult = 1.0
+
+    available = np.ones(n, dtype=bool)
+    max_similarity = np.full(n, -np.inf)
+    counts = {}
+    selected = []
+    while len(selected) < k and available.any():
+        scores = lambda_mult * relevance
+        if selected and similarity is not None:
+            scores = scores - (1 - lambda_mult) * max_similarity
+        best = int(np.argmax(np.where(available, scores, -np.inf)))
+        available[best] = False
+        selected.append(best)
+        if similarity is not None:
+            max_similarity = np.maximum(max_similarity, similarity[best])
+        group = groups[best] if groups is not None else None
+        if max_per_group and group is not None:
+            counts[group] = counts.get(group, 0) + 1
+            if counts[group] >= max_per_group:
+                available &= np.asarray([g != group for g in groups])
+    return selected
@@ -1,61 +1,146 @@
 import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
 from typing import List, Optional, Any
 from langchain.embeddings.base import Embeddings
 from langchain.docstore.document import Document
 
+from .embedding_cache import EmbeddingCache
+from .lexical import tokenize
+
 
 
 class GLMEmbeddings(Embeddings):
     api_url = "https://open.bigmodel.cn/api/paas/v4/embeddings"
     api_key: Optional[str] = None
+    model_name = "embedding-2"
 
-
-    def __init__(self, api_key: Optional[str] = None, **kwargs):
+    def __init__(self, api_key: Optional[str] = None, batch_size: int = 16, max_workers: int = 4,
+                 cache_dir: Optional[str] = "cache/embeddings", cache_max_entries: int = 100000, **kwargs):
+        """
+        :param batch_size: 每个请求中包含的文本数
+        :param max_workers: 同时进行中的批量请求数，也是连接池的大小
+        :param cache_dir: 本地向量缓存目录，None表示不使用缓存
+        :param cache_max_entries: 向量缓存的最大条目数，超出后淘汰最久未使用的条目
+        """
         self.api_key = api_key if api_key else os.getenv('GLM_API_KEY')
         if not self.api_key:
             raise ValueError(
                 "API key must be provided either as a parameter or through the API_KEY environment variable")
-
-    def embed_documents(self, documents: List[Document]) -> List[List[float]]:
-        embeddings = []
-        headers = {
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        # 复用keep-alive连接，避免每个请求都重新进行TLS握手
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=max_workers))
+        self.session.headers.update({
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.api_key}"
-        }
-        for doc in documents:
-            doc_text = clean_doc_format(doc)
-            response = requests.post(
-                self.api_url,
-                headers=headers,
-                json={"model": "embedding-2", "input": doc_text}
-            )
-            if response.status_code != 200:
-                raise Exception(f"Error: {response.status_code} {response.text}")
-            json_response = response.json()
-            embeddings.append(json_response['data'][0]['embedding'])
-            # self.logger.log(
-            #     f"Embedding Serv Summary: token={str(json_response['usage']['prompt_tokens'])}+"
-            #     f"{str(json_response['usage']['completion_tokens'])} "
-            #     f"spending={json_response['usage']['total_tokens'] * 0.0005 / 1000:.4f}CNY",
-            #     level='WARNING')
-        return embeddings
+        })
+        self.cache = EmbeddingCache(self.model_name, cache_dir, cache_max_entries) if cache_dir else None
 
-    def embed_query(self, query: str) -> List[float]:
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
-        response = requests.post(
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        response = self.session.post(
             self.api_url,
-            headers=headers,
-            json={"model": "embedding-2", "input": query}
+            json={"model": self.model_name, "input": texts}
         )
         if response.status_code != 200:
             raise Exception(f"Error: {response.status_code} {response.text}")
         json_response = response.json()
-        return json_response['data'][0]['embedding']
+        # self.logger.log(
+        #     f"Embedding Serv Summary: token={str(json_response['usage']['prompt_tokens'])}+"
+        #     f"{str(json_response['usage']['completion_tokens'])} "
+        #     f"spending={json_response['usage']['total_tokens'] * 0.0005 / 1000:.4f}CNY",
+        #     level='WARNING')
+        # 按index还原顺序，与输入一一对应
+        data = sorted(json_response['data'], key=lambda item: item['index'])
+        return [item['embedding'] for item in data]
+
+    def embed_documents(self, documents: List[Document]) -> List[List[float]]:
+        return self._embed_texts([clean_doc_format(doc) for doc in documents])
+
+    def embed_query(self, query: str) -> List[float]:
+        return self._embed_texts([query])[0]
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """
+        批量向量化多个查询，结果与逐个调用embed_query相同。
+        """
+        return self._embed_texts(list(queries))
+
+    def _embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """
+        先查询本地向量缓存，只把未命中的文本发送给接口。
+        """
+        if self.cache is None:
+            return self._embed_uncached(texts)
+
+        embeddings = self.cache.get_many(texts)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            new_embeddings = self._embed_uncached(missing_texts)
+            self.cache.put_many(missing_texts, new_embeddings)
+            for i, embedding in zip(missing, new_embeddings):
+                embeddings[i] = embedding
+        # 命中与未命中的结果统一为float32精度，保证同一文本每次得到相同的向量
+        return np.asarray(embeddings, dtype=np.float32).tolist()
+
+    def _embed_uncached(self, texts: List[str]) -> List[List[float]]:
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) <= 1:
+            return self._embed_batch(batches[0]) if batches else []
+
+        embeddings = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for batch_embeddings in executor.map(self._embed_batch, batches):
+                embeddings.extend(batch_embeddings)
+        return embeddings
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    不依赖网络的本地向量模型，用于离线建索引、CI和检索性能测试。
+
+    文本按lexical.tokenize切分（标识符按驼峰拆分，中文按相邻两字切分），词和相邻词对经crc32哈希到n_features维，
+    哈希值的最高位决定符号，词频取对数后做L2归一化。同一文本在任何机器、任何进程中得到的向量都相同。
+    """
+    model_name = "hashing"
+
+    def __init__(self, n_features: int = 1024, use_bigrams: bool = True, **kwargs):
+        self.n_features = n_features
+        self.use_bigrams = use_bigrams
+
+    def _features(self, text: str):
+        tokens = tokenize(text)
+        if self.use_bigrams:
+            tokens = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        hashes = np.fromiter((zlib.crc32(token.encode("utf-8")) for token in tokens), dtype=np.uint32,
+                             count=len(tokens))
+        signs = np.where(hashes & 0x80000000, -1.0, 1.0)
+        return hashes % self.n_features, signs
+
+    def _embed_texts(self, texts: List[str]) -> List[List[float]]:
+        vectors = np.zeros((len(texts), self.n_features), dtype=np.float32)
+        for row, text in enumerate(texts):
+            columns, signs = self._features(text)
+            np.add.at(vectors[row], columns, signs)
+        vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms == 0, 1, norms)
+        return vectors.tolist()
+
+    def embed_documents(self, documents: List[str]) -> List[List[float]]:
+        return self._embed_texts([str(doc) for doc in documents])
+
+    def embed_query(self, query: str) -> List[float]:
+        return self._embed_texts([query])[0]
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        return self._embed_texts(list(queries))
 
 
 # clean format to support JSON format
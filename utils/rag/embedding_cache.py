@@ -0,0 +1,170 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    本地持久化的向量缓存，键为(文本哈希, 模型名)，值为float32向量。
+
+    向量保存在按槽位组织的内存映射文件中，键到槽位的映射保存在SQLite里。
+    缓存条目数达到max_entries后，按最近使用时间淘汰最久未用的条目并复用其槽位。
+    以更小的max_entries重新打开时，多出的条目按同样的规则淘汰。
+    """
+
+    def __init__(self, model_name: str, cache_dir: str = "cache/embeddings", max_entries: int = 100000):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.dir = os.path.join(cache_dir, model_name)
+        os.makedirs(self.dir, exist_ok=True)
+        self.vectors_path = os.path.join(self.dir, "vectors.f32")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(self.dir, "index.db"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, slot INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._conn.commit()
+        self._vectors = None
+        dim = self._get_meta("dim")
+        if dim is not None:
+            self._open_vectors(dim)
+
+    def _get_meta(self, name: str) -> Optional[int]:
+        row = self._conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, name: str, value: int):
+        self._conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, value))
+
+    def _open_vectors(self, dim: int):
+        """
+        按max_entries个槽位映射向量文件。文件的槽位数记录在meta的capacity中，
+        max_entries比它小时先淘汰多出的条目，变大时扩展文件。
+        """
+        capacity = self._get_meta("capacity")
+        if capacity is None and os.path.exists(self.vectors_path):
+            # 没有记录capacity的旧缓存按文件大小推算
+            capacity = os.path.getsize(self.vectors_path) // (dim * 4)
+        if capacity is not None and capacity > self.max_entries:
+            self._shrink(dim, capacity)
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(self.max_entries * dim * 4)
+        self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(self.max_entries, dim))
+        self._set_meta("capacity", self.max_entries)
+        self._conn.commit()
+
+    def _shrink(self, dim: int, capacity: int):
+        """
+        只保留最近使用的max_entries个条目，槽位不小于max_entries的条目移到被淘汰条目空出的槽位中。
+        """
+        rows = self._conn.execute("SELECT key, slot FROM entries ORDER BY last_used DESC").fetchall()
+        kept, evicted = rows[:self.max_entries], rows[self.max_entries:]
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in evicted])
+        used = {slot for _, slot in kept if slot < self.max_entries}
+        free = [slot for slot in range(self.max_entries) if slot not in used]
+        moved = [(key, slot, new_slot) for (key, slot), new_slot in
+                 zip([(key, slot) for key, slot in kept if slot >= self.max_entries], free)]
+        if moved:
+            old = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(capacity, dim))
+            old[[new_slot for _, _, new_slot in moved]] = old[[slot for _, slot, _ in moved]]
+            old.flush()
+            del old
+            self._conn.executemany("UPDATE entries SET slot = ? WHERE key = ?",
+                                   [(new_slot, key) for key, _, new_slot in moved])
+        self._set_meta("next_slot", min(self._get_meta("next_slot") or 0, self.max_entries))
+        self._conn.commit()
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """
+        批量查询，返回与texts一一对应的向量，未命中的位置为None。
+        """
+        keys = [text_hash(text) for text in texts]
+        if self._vectors is None:
+            return [None] * len(keys)
+
+        slots = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                chunk = list(set(keys[i:i + 500]))
+                placeholders = ",".join("?" * len(chunk))
+                slots.update(self._conn.execute(
+                    f"SELECT key, slot FROM entries WHERE key IN ({placeholders})", chunk
+                ))
+            if slots:
+                now = time.time()
+                self._conn.executemany("UPDATE entries SET last_used = ? WHERE key = ?",
+                                       [(now, key) for key in slots])
+                self._conn.commit()
+            return [np.array(self._vectors[slots[key]]) if key in slots else None for key in keys]
+
+    def put_many(self, texts: Sequence[str], vectors: Sequence[Sequence[float]]):
+        """
+        批量写入向量，已存在的文本会被跳过。
+        """
+        if not texts:
+            return
+        array = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            if self._vectors is None:
+                self._set_meta("dim", array.shape[1])
+                self._open_vectors(array.shape[1])
+
+            pending = {}
+            for text, vector in zip(texts, array):
+                pending[text_hash(text)] = vector
+            existing = set()
+            keys = list(pending)
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                existing.update(row[0] for row in self._conn.execute(
+                    f"SELECT key FROM entries WHERE key IN ({placeholders})", chunk
+                ))
+            new_keys = [key for key in keys if key not in existing][:self.max_entries]
+            if not new_keys:
+                return
+
+            slots = self._allocate_slots(len(new_keys))
+            now = time.time()
+            for key, slot in zip(new_keys, slots):
+                self._vectors[slot] = pending[key]
+            self._vectors.flush()
+            self._conn.executemany("INSERT INTO entries (key, slot, last_used) VALUES (?, ?, ?)",
+                                   [(key, slot, now) for key, slot in zip(new_keys, slots)])
+            self._conn.commit()
+
+    def _allocate_slots(self, count: int) -> List[int]:
+        next_slot = self._get_meta("next_slot") or 0
+        fresh = list(range(next_slot, min(next_slot + count, self.max_entries)))
+        self._set_meta("next_slot", next_slot + len(fresh))
+        if len(fresh) == count:
+            return fresh
+
+        # 没有空闲槽位时淘汰最久未使用的条目
+        evicted = self._conn.execute(
+            "SELECT key, slot FROM entries ORDER BY last_used LIMIT ?", (count - len(fresh),)
+        ).fetchall()
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in evicted])
+        return fresh + [slot for _, slot in evicted]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+            self._conn.close()
@@ -0,0 +1,85 @@
+"""
+由粗到细的分层检索：先按包（源文件所在目录）的中心向量选出最相关的几个包，再只在这些包的文件中检索。
+"""
+import posixpath
+import re
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from .ann import reconstruct_vectors
+
+
+def package_of(source) -> str:
+    """
+    文件所在目录即包，例如src/main/java/com/demo/service/UserService.java属于src/main/java/com/demo/service。
+    """
+    if not source:
+        return ""
+    return posixpath.dirname(str(source).replace("\\", "/"))
+
+
+def matches_path_prefix(source, prefix: str) -> bool:
+    """
+    判断来源路径source是否位于目录或文件prefix之下，前缀之后必须是路径分隔符或路径结尾，
+    例如src/user不匹配src/userprofile/B.java。绝对路径前缀从路径开头匹配，相对路径前缀可以从任一级目录开始匹配。
+    """
+    source = str(source or "").replace("\\", "/")
+    prefix = prefix.replace("\\", "/")
+    if len(prefix) > 1:
+        prefix = prefix.rstrip("/")
+    if prefix.startswith("/") or re.match(r"[A-Za-z]:/", prefix):
+        return source == prefix or source.startswith(prefix if prefix.endswith("/") else prefix + "/")
+    return f"/{prefix}/" in f"/{source}/"
+
+
+class PackageIndex:
+    """
+    建在FAISS向量库之上的包级索引，只保存每个包的中心向量和包内向量下标，检索时按需从原索引取回向量。
+    """
+
+    def __init__(self, store: FAISS, batch_size: int = 4096):
+        self.store = store
+        members: Dict[str, List[int]] = {}
+        for position, doc_id in store.index_to_docstore_id.items():
+            doc = store.docstore.search(doc_id)
+            source = doc.metadata.get("source") if isinstance(doc, Document) else None
+            members.setdefault(package_of(source), []).append(position)
+        self.packages = sorted(members)
+        self.members = [np.asarray(members[package], dtype=np.int64) for package in self.packages]
+
+        sums = np.zeros((len(self.packages), store.index.d), dtype=np.float64)
+        owners = np.empty(store.index.ntotal, dtype=np.int64)
+        for i, positions in enumerate(self.members):
+            owners[positions] = i
+        for start in range(0, store.index.ntotal, batch_size):
+            positions = np.arange(start, min(start + batch_size, store.index.ntotal), dtype=np.int64)
+            np.add.at(sums, owners[positions], reconstruct_vectors(store.index, positions))
+        counts = np.asarray([len(positions) for positions in self.members], dtype=np.float64)
+        self.centroids = (sums / counts[:, None]).astype(np.float32)
+
+    def search(self, vectors: np.ndarray, k: int, n_packages: int,
+               allowed: Optional[np.ndarray] = None) -> List[List[str]]:
+        """
+        对每个查询向量先选出距离最近的n_packages个包，再在这些包的文件中精确检索，返回文档id列表。
+        allowed不为None时只检索其中的向量下标，没有可见文件的包不参与排序。
+        """
+        members = self.members
+        if allowed is not None:
+            members = [positions[np.isin(positions, allowed)] for positions in members]
+        results = []
+        package_distances = ((vectors ** 2).sum(axis=1)[:, None] - 2 * vectors @ self.centroids.T
+                             + (self.centroids ** 2).sum(axis=1)[None, :])
+        package_distances[:, [len(positions) == 0 for positions in members]] = np.inf
+        top_packages = np.argsort(package_distances, axis=1)[:, :n_packages]
+        for vector, packages in zip(vectors, top_packages):
+            positions = np.concatenate([members[i] for i in packages])
+            if len(positions) == 0:
+                results.append([])
+                continue
+            distances = ((reconstruct_vectors(self.store.index, positions) - vector) ** 2).sum(axis=1)
+            best = positions[np.argsort(distances)[:k]]
+            results.append([self.store.index_to_docstore_id[int(i)] for i in best])
+        return results
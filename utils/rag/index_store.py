@@ -0,0 +1,167 @@
+"""
+FAISS索引的本地存储格式：一个目录，包含原生FAISS索引文件和SQLite文档库。
+
+索引文件以只读内存映射方式读取，多个进程同时加载同一索引时通过页缓存共享，不需要反序列化pickle。
+"""
+import json
+import os
+import shutil
+import sqlite3
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import faiss
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from utils.summary_store import connect_read_only
+from .ann import get_search_params, set_search_params
+from .lexical import StoredBM25Index, lexical_text, write_bm25
+
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "docstore.db"
+
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """
+    只读打开的SQLite文档库，按需读取单个文档。
+
+    加载后对索引的增删只记录在内存中，不会修改磁盘上的文件，需要保存时由save_faiss写出新的目录。
+    """
+
+    def __init__(self, db_path: str):
+        self._conn = connect_read_only(db_path)
+        self._added: Dict[str, Document] = {}
+        self._deleted = set()
+
+    def positions(self) -> Dict[int, str]:
+        """
+        返回FAISS向量下标到文档id的映射。
+        """
+        return dict(self._conn.execute("SELECT position, id FROM documents"))
+
+    def version_positions(self) -> Optional[Dict[Tuple[str, str], List[int]]]:
+        """
+        用一次查询返回(来源文件路径, blob哈希) -> 向量下标列表。
+        加载后增删过文档（下标已经变化），或者文档库是没有source、blob列的旧格式时返回None，由调用方逐个读取文档。
+        """
+        if self._added or self._deleted:
+            return None
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(documents)")}
+        if not {"source", "blob"} <= columns:
+            return None
+        versions = {}
+        for source, blob, position in self._conn.execute("SELECT source, blob, position FROM documents"):
+            versions.setdefault((source, blob), []).append(position)
+        return versions
+
+    def lexical_index(self) -> Optional[StoredBM25Index]:
+        """
+        返回保存时写入的BM25倒排索引。加载后增删过文档，或者文档库是没有倒排表的旧格式时返回None，由调用方重新建立。
+        """
+        if self._added or self._deleted:
+            return None
+        if self._conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'bm25_meta'").fetchone() is None:
+            return None
+        return StoredBM25Index(self._conn)
+
+    def search(self, search: str) -> Union[str, Document]:
+        if search in self._added:
+            return self._added[search]
+        if search not in self._deleted:
+            row = self._conn.execute("SELECT page_content, metadata FROM documents WHERE id = ?",
+                                     (search,)).fetchone()
+            if row is not None:
+                return Document(page_content=row[0], metadata=json.loads(row[1]))
+        return f"ID {search} not found."
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        overlapping = [doc_id for doc_id in texts if not isinstance(self.search(doc_id), str)]
+        if overlapping:
+            raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+        self._added.update(texts)
+        self._deleted.difference_update(texts)
+
+    def delete(self, ids: Iterable[str]) -> None:
+        for doc_id in ids:
+            self._added.pop(doc_id, None)
+            self._deleted.add(doc_id)
+
+
+def _write_docstore(db_path: str, index: FAISS) -> None:
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "CREATE TABLE documents (position INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, "
+        "page_content TEXT NOT NULL, metadata TEXT NOT NULL, source TEXT, blob TEXT)"
+    )
+
+    def rows():
+        for position, doc_id in index.index_to_docstore_id.items():
+            doc = index.docstore.search(doc_id)
+            # source和blob单独成列，加载后不需要解析metadata就能建立版本映射
+            yield (position, doc_id, doc.page_content, json.dumps(doc.metadata, ensure_ascii=False),
+                   doc.metadata.get("source"), doc.metadata.get("blob"))
+
+    conn.executemany("INSERT INTO documents (position, id, page_content, metadata, source, blob) "
+                     "VALUES (?, ?, ?, ?, ?, ?)", rows())
+    # BM25倒排表随文档一起保存，加载索引的进程不需要对全部文档重新分词
+    write_bm25(conn, ((position, lexical_text(page_content, source))
+                      for position, page_content, source in
+                      conn.execute("SELECT position, page_content, source FROM documents")))
+    conn.commit()
+    conn.close()
+
+
+def save_faiss(index: FAISS, path: str) -> None:
+    """
+    把索引保存为目录path。先写到临时目录再整体替换，已存在的同名文件或目录会被覆盖。
+    """
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    faiss.write_index(index.index, os.path.join(tmp_path, INDEX_FILE))
+    _write_docstore(os.path.join(tmp_path, DOCSTORE_FILE), index)
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+    os.replace(tmp_path, path)
+
+
+def load_faiss(path: str, embedding_model, mmap: bool = True) -> FAISS:
+    """
+    加载save_faiss保存的目录。mmap为True时以只读内存映射方式读取索引文件，向量数据不复制到进程内存，
+    索引类型不支持时退回普通读取。映射的索引在第一次增删文档前由make_writable重新读入内存。
+    """
+    index_path = os.path.join(path, INDEX_FILE)
+    index = None
+    if mmap:
+        # IO_FLAG_MMAP_IFC才会把向量直接映射为只读视图，旧版本faiss只有IO_FLAG_MMAP
+        flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+        try:
+            index = faiss.read_index(index_path, flag)
+        except RuntimeError:
+            index = None
+    mapped = index is not None
+    if index is None:
+        index = faiss.read_index(index_path)
+    docstore = SQLiteDocstore(os.path.join(path, DOCSTORE_FILE))
+    store = FAISS(embedding_model, index, docstore, docstore.positions())
+    store.mmap_path = index_path if mapped else None
+    return store
+
+
+def make_writable(store: FAISS) -> None:
+    """
+    内存映射的索引不能增删向量（faiss会直接终止进程），修改前重新完整读入内存。
+    """
+    index_path = getattr(store, "mmap_path", None)
+    if index_path is not None:
+        params = get_search_params(store.index)
+        store.index = faiss.read_index(index_path)
+        set_search_params(store.index, **params)
+        store.mmap_path = None
+
+
+def is_faiss_dir(path) -> bool:
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, INDEX_FILE))
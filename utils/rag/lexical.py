@@ -0,0 +1,174 @@
+"""
+本地BM25倒排索引，用于按类名、接口路径、字段名等标识符精确检索摘要。
+"""
+import heapq
+import math
+import re
+import sqlite3
+from array import array
+from collections import Counter
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+_WORD = re.compile(r"[A-Za-z0-9_$]+|[一-鿿]+")
+_CAMEL_PART = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    切分出英文标识符和中文片段。标识符保留整体的小写形式，并按驼峰和下划线拆分，
+    例如UserController得到usercontroller、user、controller；中文按相邻两个字切分。
+    """
+    tokens = []
+    for word in _WORD.findall(text):
+        if "一" <= word[0] <= "鿿":
+            if len(word) == 1:
+                tokens.append(word)
+            else:
+                tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+            continue
+        tokens.append(word.lower())
+        parts = _CAMEL_PART.findall(word)
+        if len(parts) > 1:
+            tokens.extend(part.lower() for part in parts)
+    return tokens
+
+
+def lexical_text(page_content: str, source: Optional[str]) -> str:
+    # 来源路径一起参与检索，查询中的类名、包名也能命中文件路径
+    return f"{page_content}\n{source or ''}"
+
+
+class BM25Index:
+    """
+    内存中的BM25倒排索引，文档用任意可哈希的id标识。
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, List[Tuple[Hashable, int]]] = {}
+        self._lengths: Dict[Hashable, int] = {}
+        self._total_length = 0
+
+    def add(self, doc_id: Hashable, text: str) -> None:
+        counts = Counter(tokenize(text))
+        length = sum(counts.values())
+        self._lengths[doc_id] = length
+        self._total_length += length
+        for term, tf in counts.items():
+            self._postings.setdefault(term, []).append((doc_id, tf))
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def search(self, query: str, k: int, allowed: Optional[Set[Hashable]] = None) -> List[Tuple[Hashable, float]]:
+        """
+        返回得分最高的k个(文档id, 得分)，按得分从高到低排列。allowed不为None时只返回其中的文档。
+        """
+        if not self._lengths:
+            return []
+        n = len(self._lengths)
+        avg_length = self._total_length / n
+        scores: Dict[Hashable, float] = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings:
+                if allowed is not None and doc_id not in allowed:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+def write_bm25(conn: sqlite3.Connection, documents: Iterable[Tuple[int, str]]) -> None:
+    """
+    对(向量下标, 文本)分词，把BM25倒排表写入conn中的bm25_terms和bm25_meta两张表，由StoredBM25Index读取。
+    """
+    postings: Dict[str, Tuple[array, array]] = {}
+    lengths = array("i")
+    for position, text in documents:
+        counts = Counter(tokenize(text))
+        if position >= len(lengths):
+            lengths.extend([0] * (position + 1 - len(lengths)))
+        lengths[position] = sum(counts.values())
+        for term, tf in counts.items():
+            entry = postings.get(term)
+            if entry is None:
+                entry = postings[term] = (array("i"), array("i"))
+            entry[0].append(position)
+            entry[1].append(tf)
+    conn.execute("CREATE TABLE bm25_terms (term TEXT PRIMARY KEY, positions BLOB NOT NULL, tfs BLOB NOT NULL)")
+    conn.execute("CREATE TABLE bm25_meta (lengths BLOB NOT NULL)")
+    conn.executemany("INSERT INTO bm25_terms (term, positions, tfs) VALUES (?, ?, ?)",
+                     ((term, np.asarray(positions, dtype="<i4").tobytes(), np.asarray(tfs, dtype="<i4").tobytes())
+                      for term, (positions, tfs) in postings.items()))
+    conn.execute("INSERT INTO bm25_meta (lengths) VALUES (?)", (np.asarray(lengths, dtype="<i4").tobytes(),))
+
+
+class StoredBM25Index:
+    """
+    write_bm25写入SQLite的BM25倒排索引，文档用向量下标标识，得分与BM25Index相同。
+    检索时只读取查询中出现的词的倒排表，加载时不需要对文档重新分词。
+    """
+
+    def __init__(self, conn: sqlite3.Connection, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._conn = conn
+        row = conn.execute("SELECT lengths FROM bm25_meta").fetchone()
+        lengths = np.frombuffer(row[0], dtype="<i4").astype(np.float64)
+        self._n = len(lengths)
+        avg_length = lengths.mean() if self._n else 0.0
+        self._norms = k1 * (1 - b + b * lengths / avg_length) if avg_length else np.full(self._n, k1 * (1 - b))
+
+    def __len__(self) -> int:
+        return self._n
+
+    def search(self, query: str, k: int, allowed: Optional[Set[int]] = None) -> List[Tuple[int, float]]:
+        """
+        返回得分最高的k个(向量下标, 得分)，按得分从高到低排列。allowed不为None时只返回其中的文档。
+        """
+        if not self._n:
+            return []
+        scores = np.zeros(self._n)
+        matched = np.zeros(self._n, dtype=bool)
+        for term in set(tokenize(query)):
+            row = self._conn.execute("SELECT positions, tfs FROM bm25_terms WHERE term = ?", (term,)).fetchone()
+            if row is None:
+                continue
+            positions = np.frombuffer(row[0], dtype="<i4")
+            tfs = np.frombuffer(row[1], dtype="<i4").astype(np.float64)
+            idf = math.log(1 + (self._n - len(positions) + 0.5) / (len(positions) + 0.5))
+            scores[positions] += idf * tfs * (self.k1 + 1) / (tfs + self._norms[positions])
+            matched[positions] = True
+        if allowed is not None:
+            mask = np.zeros(self._n, dtype=bool)
+            mask[np.fromiter(allowed, dtype=np.int64, count=len(allowed))] = True
+            matched &= mask
+        candidates = np.flatnonzero(matched)
+        top = candidates[np.argsort(-scores[candidates], kind="stable")[:k]]
+        return [(int(position), float(scores[position])) for position in top]
+
+
+def reciprocal_rank_scores(rankings: List[List[Hashable]], c: int = 60) -> Dict[Hashable, float]:
+    """
+    返回每个id按倒数排名融合(RRF)得到的分数。
+    """
+    scores: Dict[Hashable, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (c + rank + 1)
+    return scores
+
+
+def reciprocal_rank_fusion(rankings: List[List[Hashable]], k: int, c: int = 60) -> List[Hashable]:
+    """
+    按倒数排名融合(RRF)合并多个排序结果，返回前k个id。
+    """
+    scores = reciprocal_rank_scores(rankings, c)
+    return heapq.nlargest(k, scores, key=scores.get)
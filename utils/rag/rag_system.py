@@ -1,82 +1,395 @@
-from typing import List
+import functools
+import heapq
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
 
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 
 from glm import ChatGLM, ModelType
+from .ann import (build_faiss_index, get_search_params, reconstruct_vectors, removes_contiguously,
+                  selector_search_params, set_search_params)
 from .embedding import GLMEmbeddings
 from .content_provider import RAGContentProvider
+from .diversity import mmr_select
+from .hierarchy import PackageIndex, matches_path_prefix
+from .lexical import BM25Index, StoredBM25Index, lexical_text, reciprocal_rank_scores
+from .index_store import SQLiteDocstore, is_faiss_dir, load_faiss, make_writable, save_faiss
+
+# 检索范围内的向量不超过这个数量时不使用索引，直接精确计算距离
+EXACT_FILTER_SIZE = 4096
+
+
+def _make_embeddings(embedding_model):
+    # 在使用时才创建向量模型，避免导入模块时就需要API key
+    if embedding_model is None:
+        return GLMEmbeddings()
+    if isinstance(embedding_model, type):
+        return embedding_model()
+    return embedding_model
+
+
+class _LazyEmbeddings(Embeddings):
+    """
+    第一次向量化时才用_make_embeddings创建向量模型，加载索引后只做BM25检索或组装提示词时不需要API key。
+    """
+
+    def __init__(self, embedding_model):
+        self._embedding_model = embedding_model
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        with self._lock:
+            if self._model is None:
+                self._model = _make_embeddings(self._embedding_model)
+            return self._model
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._get_model().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._get_model().embed_query(text)
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        model = self._get_model()
+        if hasattr(model, "embed_queries"):
+            return model.embed_queries(queries)
+        return model.embed_documents(queries)
+
+
+def _make_llm(llm):
+    # 与向量模型相同，LLM客户端也在使用时才创建
+    if llm is None:
+        return ChatGLM()
+    if isinstance(llm, (type, functools.partial)):
+        return llm()
+    return llm
+
+
+def _build_store(embedding_model, texts, metadatas, vectors, index_type, index_params) -> FAISS:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    store = FAISS(embedding_model, build_faiss_index(vectors, index_type, **index_params), InMemoryDocstore(), {})
+    store.add_embeddings(zip(texts, vectors.tolist()), metadatas)
+    return store
 
 
 class RAGSystem:
     @classmethod
-    def from_content_provider(cls, content_provider, template, embedding_model=GLMEmbeddings, llm=ChatGLM(), top_k=5):
+    def from_content_provider(cls, content_provider, template, embedding_model=None, llm=None, top_k=5,
+                              index_type="flat", nprobe=None, ef_search=None, k_factor=None, train_size=20000,
+                              **index_params):
         """
 
         :param content_provider:
         :param template: 如果只需要生成缓存，可以把本项设置为None。
-        :param embedding_model:
-        :param llm:
+        :param embedding_model: 向量模型的类或实例，默认为GLMEmbeddings。
+        :param llm: 默认为ChatGLM()。
         :param top_k:
+        :param index_type: flat、ivf_flat、ivf_pq或hnsw，见ann模块。hnsw和带重排(rerank)的索引不支持直接删除向量，
+            增量更新删除文档时会重建整个索引。
+        :param nprobe: IVF索引检索时访问的聚类数。
+        :param ef_search: HNSW索引检索时的候选队列长度。
+        :param k_factor: 带重排的索引（index_params中rerank=True）先取出k*k_factor个候选再精确重排。
+        :param index_params: 传给build_faiss_index的建索引参数，例如nlist、pq_m、hnsw_m。
+        :param train_size: 需要训练的索引类型先积累这么多向量用于训练，之后的批次直接加入索引。
         :return:
         """
-        index = FAISS.from_documents(content_provider.get_documents(), embedding_model())
-        return cls(content_provider, embedding_model(), index, llm, template, top_k)
+        embedding_model = _make_embeddings(embedding_model)
+        if index_type == "flat":
+            train_size = 1
+        index = None
+        pending_texts, pending_metadatas, pending_vectors = [], [], []
+        # 文档按批读取、向量化后立即加入索引，不会同时保留所有文档
+        for batch in content_provider.iter_documents():
+            texts = [doc.page_content for doc in batch]
+            metadatas = [doc.metadata for doc in batch]
+            vectors = embedding_model.embed_documents(texts)
+            if index is not None:
+                index.add_embeddings(zip(texts, vectors), metadatas)
+                continue
+            pending_texts.extend(texts)
+            pending_metadatas.extend(metadatas)
+            pending_vectors.extend(vectors)
+            if len(pending_vectors) >= train_size:
+                index = _build_store(embedding_model, pending_texts, pending_metadatas, pending_vectors,
+                                     index_type, index_params)
+                pending_texts, pending_metadatas, pending_vectors = [], [], []
+        if index is None:
+            if not pending_vectors:
+                raise ValueError("No documents to index")
+            index = _build_store(embedding_model, pending_texts, pending_metadatas, pending_vectors,
+                                 index_type, index_params)
+        set_search_params(index.index, nprobe, ef_search, k_factor)
+        return cls(content_provider, embedding_model, index, llm, template, top_k)
 
     def update_template(self, template):
         self.prompt = ChatPromptTemplate(template)
-        self.rag_chain = (
-            self.prompt |
-            self.llm |
-            StrOutputParser()
-        )
+        self.rag_chain = None
 
     def __init__(self, content_provider, embedding_model, index, llm, prompt: str, k, index_fake = None):
+        """
+        llm为LLM实例、类或无参数的工厂函数，默认为ChatGLM。只有query会调用LLM，客户端在第一次query时才创建，
+        因此只检索或组装提示词时不需要API key。
+        """
+        self.llm = llm
+        self.rag_chain = None
         if prompt is not None:
-            self.llm = llm
             self.prompt_str = prompt
             self.prompt = ChatPromptTemplate.from_template(prompt)
-            self.k = k
-            self.rag_chain = (
-                    self.prompt
-                    | self.llm
-                    | StrOutputParser()
-            )
-            self.content_provider = content_provider
-            self.embedding_model = embedding_model
+        self.k = k
+        self.content_provider = content_provider
+        self.embedding_model = embedding_model
         self.index: FAISS = index
         self.index_fake: FAISS = index_fake
+        # hybrid：向量检索与BM25融合；vector：只用向量检索；lexical：只用BM25，不需要调用向量接口
+        self.retrieval_mode = "hybrid"
+        self._lexical: Optional[Union[BM25Index, StoredBM25Index]] = None
+        self._derived_lock = threading.Lock()
+        # 设置为正整数时向量检索先选出最相关的package_top个包，只在这些包的文件中检索
+        self.package_top: Optional[int] = None
+        self._packages: Optional[PackageIndex] = None
+        # 共享索引中每个文档带有(source, blob)版本，设置后只检索这些版本的文档，见set_visible_versions
+        self.visible_versions: Optional[Set[Tuple[str, str]]] = None
+        self._versions: Optional[Dict[Tuple[str, str], List[int]]] = None
+        self._visible: Optional[np.ndarray] = None
+        # 设置后只检索来源路径以这些前缀开头的文档，见set_path_prefixes
+        self.path_prefixes: Optional[List[str]] = None
+        self._prefixed: Optional[np.ndarray] = None
+        # 设置为0到1之间的数时按最大边际相关(MMR)重排检索结果，越小越偏向与已选结果不同的文档
+        self.mmr_lambda: Optional[float] = None
+        # 设置为正整数时每个来源文件最多保留这么多个文档
+        self.max_per_source: Optional[int] = None
+        self._positions_by_id: Optional[Dict[str, int]] = None
 
-    def get_assembled_prompt(self, query, history, enable_fake_detect=False):
-        prompt = self.prompt_str
-        prompt = prompt.replace("{{question}}", query)
+    def _invalidate_derived(self):
+        # 文档增删后，BM25索引、包级索引和版本映射在下次使用时重新建立
+        with self._derived_lock:
+            self._lexical = None
+            self._packages = None
+            self._versions = None
+            self._visible = None
+            self._prefixed = None
+            self._positions_by_id = None
 
-        conversation_history = []
-        if history is None:
-            history = []
-        for message in history:
-            if message["role"] == "user":
-                conversation_history.append(f"Human: {message['content']}")
-            elif message["role"] == "assistant":
-                conversation_history.append(f"AI: {message['content']}")
+    def _version_positions(self) -> Dict[Tuple[str, str], List[int]]:
+        """
+        返回(来源文件路径, blob哈希) -> 向量下标列表。
+        """
+        with self._derived_lock:
+            if self._versions is None and isinstance(self.index.docstore, SQLiteDocstore):
+                # 刚加载的本地索引直接从文档库的source、blob列读取
+                self._versions = self.index.docstore.version_positions()
+            if self._versions is None:
+                versions = {}
+                for position, doc_id in self.index.index_to_docstore_id.items():
+                    doc = self.index.docstore.search(doc_id)
+                    if isinstance(doc, Document):
+                        key = (doc.metadata.get("source"), doc.metadata.get("blob"))
+                        versions.setdefault(key, []).append(position)
+                self._versions = versions
+            return self._versions
 
-        prompt = prompt.replace("{{history}}", "\n".join(conversation_history))
+    def set_visible_versions(self, versions: Optional[Iterable[Tuple[str, str]]]):
+        """
+        把检索范围限制在versions中的(来源文件路径, blob哈希)，通常是某个提交中存在的全部文件；None表示不限制。
+        """
+        with self._derived_lock:
+            self.visible_versions = set(versions) if versions is not None else None
+            self._visible = None
 
-        retrieved_context = self.index.as_retriever(search_kwargs={"k": self.k}).get_relevant_documents(
-            query + "\n".join(conversation_history))
+    @staticmethod
+    def _positions_of_versions(version_positions: Dict[Tuple[str, str], List[int]],
+                               versions: Iterable[Tuple[str, str]]) -> np.ndarray:
+        positions = [position for key in versions for position in version_positions.get(key, ())]
+        return np.asarray(sorted(positions), dtype=np.int64)
 
-        prompt = prompt.replace("{{context}}", str(retrieved_context))
+    def _visible_positions(self) -> Optional[np.ndarray]:
+        if self.visible_versions is None:
+            return None
+        versions = self._version_positions()
+        with self._derived_lock:
+            if self._visible is None:
+                self._visible = self._positions_of_versions(versions, self.visible_versions)
+            return self._visible
 
-        if enable_fake_detect:
-            fake_str = self.index_fake.as_retriever(search_kwargs={"k": 1}).get_relevant_documents(query)
+    def set_path_prefixes(self, prefixes: Optional[Iterable[str]]):
+        """
+        把检索范围限制在来源路径以prefixes中任一前缀开头的文档，例如某个模块或包的目录；None表示不限制。
+        前缀可以是从路径开头匹配的绝对路径，也可以是从某一级目录开始的相对路径，例如src/main/java/com/demo/service，
+        匹配规则见hierarchy.matches_path_prefix。
+        """
+        with self._derived_lock:
+            self.path_prefixes = list(prefixes) if prefixes is not None else None
+            self._prefixed = None
 
-            prompt = prompt.replace("{fake}", str(fake_str))
+    def _prefixed_positions(self) -> Optional[np.ndarray]:
+        if self.path_prefixes is None:
+            return None
+        versions = self._version_positions()
+        with self._derived_lock:
+            if self._prefixed is None:
+                positions = [position for (source, _), members in versions.items()
+                             if any(matches_path_prefix(source, prefix) for prefix in self.path_prefixes)
+                             for position in members]
+                self._prefixed = np.asarray(sorted(positions), dtype=np.int64)
+            return self._prefixed
 
-        return prompt, retrieved_context
+    def _allowed_positions(self, versions: Optional[Iterable[Tuple[str, str]]] = None) -> Optional[np.ndarray]:
+        """
+        返回可见版本与路径前缀共同限定的向量下标，两者都没有设置时为None。versions不为None时代替visible_versions。
+        """
+        if versions is None:
+            visible = self._visible_positions()
+        else:
+            visible = self._positions_of_versions(self._version_positions(), versions)
+        prefixed = self._prefixed_positions()
+        if visible is None:
+            return prefixed
+        if prefixed is None:
+            return visible
+        return np.intersect1d(visible, prefixed, assume_unique=True)
 
+    def _position_of(self, doc_id: str) -> int:
+        with self._derived_lock:
+            if self._positions_by_id is None:
+                self._positions_by_id = {value: key for key, value in self.index.index_to_docstore_id.items()}
+            return self._positions_by_id[doc_id]
 
-    def query(self, query, history: List[dict] = None):
+    def _diversify(self, scores: Dict[str, float], k) -> List[str]:
+        """
+        按mmr_lambda和max_per_source从融合后的候选中选出至多k个文档id。
+        文档向量从FAISS索引中取回，不需要再调用向量接口。
+        """
+        doc_ids = heapq.nlargest(len(scores), scores, key=scores.get)
+        docs = [self.index.docstore.search(doc_id) for doc_id in doc_ids]
+        sources = [doc.metadata.get("source") if isinstance(doc, Document) else None for doc in docs]
+        vectors = None
+        if self.mmr_lambda is not None and doc_ids:
+            positions = np.asarray([self._position_of(doc_id) for doc_id in doc_ids], dtype=np.int64)
+            vectors = reconstruct_vectors(self.index.index, positions)
+        selected = mmr_select([scores[doc_id] for doc_id in doc_ids], k, vectors,
+                              self.mmr_lambda if self.mmr_lambda is not None else 1.0, sources, self.max_per_source)
+        return [doc_ids[i] for i in selected]
+
+    def _package_index(self) -> PackageIndex:
+        with self._derived_lock:
+            if self._packages is None:
+                self._packages = PackageIndex(self.index)
+            return self._packages
+
+    def _lexical_index(self) -> Union[BM25Index, StoredBM25Index]:
+        """
+        返回按向量下标标识文档的BM25索引。从目录加载且未修改时直接使用保存的倒排表，
+        否则首次使用时根据文档库建立，文档增删后重新建立。
+        """
+        with self._derived_lock:
+            if self._lexical is None:
+                lexical = None
+                if isinstance(self.index.docstore, SQLiteDocstore):
+                    lexical = self.index.docstore.lexical_index()
+                if lexical is None:
+                    lexical = BM25Index()
+                    for position, doc_id in self.index.index_to_docstore_id.items():
+                        doc = self.index.docstore.search(doc_id)
+                        if isinstance(doc, Document):
+                            lexical.add(position, lexical_text(doc.page_content, doc.metadata.get("source")))
+                self._lexical = lexical
+            return self._lexical
+
+    def _embed_queries(self, queries: List[str]) -> np.ndarray:
+        # 多个查询在一次批量调用中向量化，GLMEmbeddings以外的模型使用embed_documents作为批量接口
+        if len(queries) == 1:
+            vectors = [self.embedding_model.embed_query(queries[0])]
+        elif hasattr(self.embedding_model, "embed_queries"):
+            vectors = self.embedding_model.embed_queries(queries)
+        else:
+            vectors = self.embedding_model.embed_documents(queries)
+        return np.asarray(vectors, dtype=np.float32)
+
+    @staticmethod
+    def _search_by_vectors(index: FAISS, vectors: np.ndarray, k, allowed: Optional[np.ndarray] = None
+                           ) -> List[List[str]]:
+        """
+        对多个查询向量做一次矩阵检索，返回每个查询的文档id列表。allowed不为None时只在这些向量下标中检索。
+        """
+        if allowed is None:
+            _, positions = index.index.search(vectors, k)
+            return [[index.index_to_docstore_id[i] for i in row if i != -1] for row in positions]
+
+        if len(allowed) == 0:
+            return [[] for _ in vectors]
+        if len(allowed) <= EXACT_FILTER_SIZE:
+            # 可见向量很少时直接精确计算距离，避免IVF等索引在未访问的聚类中漏掉它们
+            candidates = reconstruct_vectors(index.index, allowed)
+            distances = (candidates ** 2).sum(axis=1)[None, :] - 2 * vectors @ candidates.T
+            order = np.argsort(distances, axis=1)[:, :k]
+            return [[index.index_to_docstore_id[int(allowed[i])] for i in row] for row in order]
+
+        selector = faiss.IDSelectorBatch(allowed)
+        params = selector_search_params(index.index, selector)
+        if params is not None:
+            _, positions = index.index.search(vectors, k, params=params)
+            return [[index.index_to_docstore_id[i] for i in row if i != -1] for row in positions]
+        # 索引不支持按id过滤时多取一些结果再过滤
+        allowed_set = set(allowed.tolist())
+        _, positions = index.index.search(vectors, min(k * 10, index.index.ntotal))
+        return [[index.index_to_docstore_id[i] for i in row if i in allowed_set][:k] for row in positions]
+
+    def retrieve_many(self, queries: List[str], k=None,
+                      versions: Optional[List[Optional[Iterable[Tuple[str, str]]]]] = None) -> List[List[Document]]:
+        """
+        按retrieval_mode批量检索，返回与queries一一对应的文档列表，hybrid模式下用RRF合并向量检索和BM25的结果。
+        可见版本和路径前缀在检索时过滤；设置了mmr_lambda或max_per_source时再从融合后的候选中做多样化选择。
+        versions不为None时与queries一一对应，每个查询只检索自己的(来源文件路径, blob哈希)集合（None表示使用visible_versions），
+        不同提交的查询可以一起检索：所有查询只向量化一次，版本集合相同的查询合并为一次矩阵检索。
+        """
+        k = k or self.k
+        fetch_k = max(k * 4, 20)
+        groups: Dict[Optional[frozenset], List[int]] = {}
+        for i in range(len(queries)):
+            key = None if versions is None or versions[i] is None else frozenset(versions[i])
+            groups.setdefault(key, []).append(i)
+
+        vectors = self._embed_queries(queries) if self.retrieval_mode != "lexical" else None
+        lexical = self._lexical_index() if self.retrieval_mode != "vector" else None
+        rankings = [[] for _ in queries]
+        for key, members in groups.items():
+            allowed = self._allowed_positions(key)
+            if vectors is not None:
+                if self.package_top:
+                    vector_results = self._package_index().search(vectors[members], fetch_k, self.package_top,
+                                                                  allowed)
+                else:
+                    vector_results = self._search_by_vectors(self.index, vectors[members], fetch_k, allowed)
+                for i, doc_ids in zip(members, vector_results):
+                    rankings[i].append(doc_ids)
+            if lexical is not None:
+                allowed_set = set(allowed.tolist()) if allowed is not None else None
+                for i in members:
+                    rankings[i].append([self.index.index_to_docstore_id[position]
+                                        for position, _ in lexical.search(queries[i], fetch_k, allowed_set)])
+        results = []
+        for ranking in rankings:
+            scores = reciprocal_rank_scores(ranking)
+            if self.mmr_lambda is not None or self.max_per_source:
+                doc_ids = self._diversify(scores, k)
+            else:
+                doc_ids = heapq.nlargest(k, scores, key=scores.get)
+            results.append([self.index.docstore.search(doc_id) for doc_id in doc_ids])
+        return results
+
+    def retrieve(self, query, k=None) -> List[Document]:
+        return self.retrieve_many([query], k)[0]
+
+    @staticmethod
+    def _format_history(history) -> List[str]:
         conversation_history = []
         if history is None:
             history = []
@@ -85,27 +398,180 @@ class RAGSystem:
                 conversation_history.append(f"Human: {message['content']}")
             elif message["role"] == "assistant":
                 conversation_history.append(f"AI: {message['content']}")
+        return conversation_history
+
+    def get_assembled_prompts(self, queries: List[Tuple[str, List[dict]]], enable_fake_detect=False,
+                              versions: Optional[List[Optional[Iterable[Tuple[str, str]]]]] = None):
+        """
+        批量组装提示词，queries为[(query, history)]，返回与之一一对应的[(prompt, retrieved_context)]。
+        所有查询只做一次批量向量化，共用当前的path_prefixes；versions与retrieve_many相同，
+        为每个查询指定所属提交的版本集合，不指定时共用visible_versions。
+        """
+        histories = [self._format_history(history) for _, history in queries]
+        contexts = self.retrieve_many([query + "\n".join(conversation_history)
+                                       for (query, _), conversation_history in zip(queries, histories)],
+                                      versions=versions)
+
+        fakes = None
+        if enable_fake_detect:
+            vectors = self._embed_queries([query for query, _ in queries])
+            fakes = [[self.index_fake.docstore.search(doc_id) for doc_id in doc_ids]
+                     for doc_ids in self._search_by_vectors(self.index_fake, vectors, 1)]
+
+        results = []
+        for i, ((query, _), conversation_history, retrieved_context) in enumerate(zip(queries, histories, contexts)):
+            prompt = self.prompt_str
+            prompt = prompt.replace("{{question}}", query)
+            prompt = prompt.replace("{{history}}", "\n".join(conversation_history))
+            prompt = prompt.replace("{{context}}", str(retrieved_context))
+            if fakes is not None:
+                prompt = prompt.replace("{fake}", str(fakes[i]))
+            results.append((prompt, retrieved_context))
+        return results
 
-        retrieved_context = self.index.as_retriever(search_kwargs={"k": self.k}).get_relevant_documents(
-            query + "\n".join(conversation_history))
+    def get_assembled_prompt(self, query, history, enable_fake_detect=False):
+        return self.get_assembled_prompts([(query, history)], enable_fake_detect)[0]
+
+    def _get_rag_chain(self):
+        if self.rag_chain is None:
+            self.llm = _make_llm(self.llm)
+            self.rag_chain = (
+                    self.prompt
+                    | self.llm
+                    | StrOutputParser()
+            )
+        return self.rag_chain
 
-        return self.rag_chain.invoke(
+    def query(self, query, history: List[dict] = None):
+        conversation_history = self._format_history(history)
+
+        retrieved_context = self.retrieve(query + "\n".join(conversation_history))
+
+        return self._get_rag_chain().invoke(
         {"context": retrieved_context, "question": query, "history": conversation_history})
 
+    def _ids_by_document(self) -> Dict[Tuple[str, str], List[str]]:
+        """
+        返回(来源文件路径, 文档内容) -> 文档id列表。来源取自metadata中的source，旧索引中没有来源时为None。
+        """
+        result = {}
+        for doc_id in self.index.index_to_docstore_id.values():
+            doc = self.index.docstore.search(doc_id)
+            if not isinstance(doc, Document):
+                continue
+            result.setdefault((doc.metadata.get("source"), doc.page_content), []).append(doc_id)
+        return result
+
+    def add_documents(self, documents: List[Document]) -> int:
+        """
+        把文档向量化后追加到索引中，返回追加的文档数。
+        """
+        if not documents:
+            return 0
+        make_writable(self.index)
+        self.index.add_documents(documents)
+        self._invalidate_derived()
+        return len(documents)
+
+    def _delete_ids(self, ids: List[str]):
+        """
+        从索引中删除文档。LangChain删除后把向量下标重新编号为0..n-1，只有remove_ids会前移剩余向量的索引类型
+        （见ann.removes_contiguously）可以直接删除；IVF、HNSW和带重排的索引取回其余向量，清空索引后重新加入，
+        索引类型和检索参数保持不变，耗时与索引大小成正比。
+        """
+        make_writable(self.index)
+        if removes_contiguously(self.index.index):
+            self.index.delete(ids)
+        else:
+            ids = set(ids)
+            kept = sorted(position for position, doc_id in self.index.index_to_docstore_id.items()
+                          if doc_id not in ids)
+            vectors = reconstruct_vectors(self.index.index, np.asarray(kept, dtype=np.int64))
+            params = get_search_params(self.index.index)
+            self.index.index.reset()
+            self.index.index.add(vectors)
+            set_search_params(self.index.index, **params)
+            self.index.docstore.delete(list(ids))
+            self.index.index_to_docstore_id = {i: self.index.index_to_docstore_id[position]
+                                               for i, position in enumerate(kept)}
+        self._invalidate_derived()
+
+    def remove_sources(self, sources: Iterable[str]) -> int:
+        """
+        删除来源文件路径在sources中的全部文档，返回删除的文档数。
+        """
+        sources = set(sources)
+        ids = [doc_id for (source, _), doc_ids in self._ids_by_document().items() if source in sources
+               for doc_id in doc_ids]
+        if ids:
+            self._delete_ids(ids)
+        return len(ids)
+
+    def replace_sources(self, documents: List[Document]) -> Tuple[int, int]:
+        """
+        用documents替换同一来源文件的旧文档，返回(追加数, 删除数)。
+        """
+        removed = self.remove_sources({doc.metadata["source"] for doc in documents})
+        return self.add_documents(documents), removed
+
+    def update_from_content_provider(self, content_provider) -> Tuple[int, int]:
+        """
+        让索引与content_provider给出的文档集合保持一致：内容未变的文档保留原向量，
+        只为新增或改动的文档计算向量，并删除已经不存在的文档。返回(追加数, 删除数)。
+        """
+        existing = self._ids_by_document()
+        wanted = set()
+        added = 0
+        for batch in content_provider.iter_documents():
+            keys = [(doc.metadata.get("source"), doc.page_content) for doc in batch]
+            wanted.update(keys)
+            added += self.add_documents([doc for doc, key in zip(batch, keys) if key not in existing])
+        stale = [doc_id for key, doc_ids in existing.items() if key not in wanted for doc_id in doc_ids]
+        if stale:
+            self._delete_ids(stale)
+        return added, len(stale)
+
+    def add_missing_versions(self, content_provider) -> int:
+        """
+        把content_provider中(来源文件路径, blob哈希)在索引里还不存在的文档追加进去，返回追加的文档数。
+        已有版本的文档不会重复向量化，也不会删除任何文档，因此同一个索引可以供多个提交共用。
+        """
+        existing = set(self._version_positions())
+        added = 0
+        for batch in content_provider.iter_documents():
+            added += self.add_documents([doc for doc in batch
+                                         if (doc.metadata.get("source"), doc.metadata.get("blob")) not in existing])
+        return added
+
     def save_index(self, path):
-        bytes = self.index.serialize_to_bytes()
-        with open(path, "wb") as f:
-            f.write(bytes)
+        """
+        把索引保存为目录path，其中是原生FAISS索引文件和SQLite文档库，见index_store。
+        """
+        save_faiss(self.index, path)
 
-    @classmethod
-    def load_index(cls, path, prompt, embedding_model=GLMEmbeddings(), path_fake : str = None):
+    @staticmethod
+    def _read_index(path, embedding_model, mmap):
+        # 兼容旧版本保存的pickle格式单文件索引
+        if is_faiss_dir(path):
+            return load_faiss(path, embedding_model, mmap)
         with open(path, "rb") as f:
             bytes = f.read()
-        index = FAISS.deserialize_from_bytes(bytes, embedding_model, allow_dangerous_deserialization=True)
+        return FAISS.deserialize_from_bytes(bytes, embedding_model, allow_dangerous_deserialization=True)
+
+    @classmethod
+    def load_index(cls, path, prompt, embedding_model=None, path_fake : str = None, mmap=True,
+                   nprobe=None, ef_search=None, k_factor=None):
+        """
+        embedding_model为向量模型的类或实例，默认为GLMEmbeddings，在第一次向量化时才创建。
+        mmap为True时以只读内存映射方式读取索引文件，增删文档前会自动读入内存，修改不会写回原文件。
+        索引类型保存在索引文件中，nprobe、ef_search分别调整IVF、HNSW索引的检索精度与速度，k_factor调整重排的候选数。
+        """
+        embedding_model = _LazyEmbeddings(embedding_model)
+        index = cls._read_index(path, embedding_model, mmap)
+        set_search_params(index.index, nprobe, ef_search, k_factor)
         if path_fake is not None:
-            with open(path_fake, "rb") as f:
-                bytes = f.read()
-            index_fake = FAISS.deserialize_from_bytes(bytes, embedding_model, allow_dangerous_deserialization=True)
-            return cls(None, embedding_model, index, ChatGLM(model_type=ModelType.GLM_4), prompt, 10, index_fake)
+            index_fake = cls._read_index(path_fake, embedding_model, mmap)
+            llm = functools.partial(ChatGLM, model_type=ModelType.GLM_4)
+            return cls(None, embedding_model, index, llm, prompt, 10, index_fake)
 
-        return cls(None, embedding_model, index, ChatGLM(), prompt, 10, None)
+        return cls(None, embedding_model, index, None, prompt, 10, None)
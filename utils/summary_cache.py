@@ -0,0 +1,58 @@
+import os
+import sqlite3
+import threading
+from typing import Optional
+
+
+class SummaryCache:
+    """
+    持久化的文件摘要缓存。
+
+    键为 (文件blob哈希, 提示词模板ID, 模型ID)，内容相同的文件在不同提交之间只需总结一次。
+    """
+
+    def __init__(self, db_path: str = "cache/summary_cache.db"):
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS summaries (
+                blob_hash TEXT NOT NULL,
+                template_id TEXT NOT NULL,
+                model_id TEXT NOT NULL,
+                summary TEXT NOT NULL,
+                PRIMARY KEY (blob_hash, template_id, model_id)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def get(self, blob_hash: str, template_id: str, model_id: str) -> Optional[str]:
+        """
+        查询缓存的摘要，未命中时返回None。
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary FROM summaries WHERE blob_hash = ? AND template_id = ? AND model_id = ?",
+                (blob_hash, template_id, model_id),
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, blob_hash: str, template_id: str, model_id: str, summary: str) -> None:
+        """
+        写入摘要，已存在的记录会被覆盖。
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries (blob_hash, template_id, model_id, summary) VALUES (?, ?, ?, ?)",
+                (blob_hash, template_id, model_id, summary),
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,382 @@
+"""
+基于asyncio的统一摘要引擎。
+
+不同模型服务通过后端(Backend)接入，引擎负责读取文件、查询摘要缓存、限制并发数和每分钟请求数。
+"""
+import asyncio
+import json
+import os
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional, Tuple
+
+from utils.git import git_blob_hash
+from utils.tokens import BYTES_PER_TOKEN, estimate_file_tokens, estimate_tokens
+
+
+class SummaryBackend(ABC):
+    """
+    摘要后端的基类，子类需要提供model_id并实现complete。
+    """
+    model_id: str = ""
+
+    @abstractmethod
+    async def complete(self, prompt: str) -> str:
+        """
+        发送提示词，返回模型输出的文本。
+        """
+        ...
+
+
+class GLMBackend(SummaryBackend):
+    """
+    智谱GLM后端，ChatGLM是同步接口，放到线程中执行以免阻塞事件循环。
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.model_id = model.model_type.model_code
+
+    async def complete(self, prompt: str) -> str:
+        return await asyncio.to_thread(self.model, prompt)
+
+
+class ArkBatchBackend(SummaryBackend):
+    """
+    火山引擎批量推理后端，client为volcenginesdkarkruntime.AsyncArk实例。
+    """
+
+    def __init__(self, ark_client, ark_bi_model: str):
+        self.client = ark_client
+        self.model_id = ark_bi_model
+
+    async def complete(self, prompt: str) -> str:
+        completion = await self.client.batch_chat.completions.create(
+            model=self.model_id,
+            messages=[
+                {"role": "system", "content": prompt},
+            ],
+        )
+        return completion.choices[0].message.content
+
+
+class OpenAIBackend(SummaryBackend):
+    """
+    OpenAI兼容接口后端，client为同步的openai.OpenAI实例。
+    """
+
+    def __init__(self, openai_client, openai_model: str):
+        self.client = openai_client
+        self.model_id = openai_model
+
+    async def complete(self, prompt: str) -> str:
+        completion = await asyncio.to_thread(
+            self.client.chat.completions.create,
+            model=self.model_id,
+            messages=[
+                {"role": "system", "content": prompt},
+            ],
+        )
+        return completion.choices[0].message.content
+
+
+class RateLimiter:
+    """
+    按每分钟请求数平滑限流，相邻两次请求的发出时间至少间隔 60 / requests_per_minute 秒。
+    """
+
+    def __init__(self, requests_per_minute: float):
+        self.interval = 60.0 / requests_per_minute
+        self._next_time = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            now = asyncio.get_running_loop().time()
+            delay = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def parse_packed_response(response: str) -> Dict[str, str]:
+    """
+    解析打包摘要的模型输出，返回{文件路径: 摘要}，无法解析时返回空字典。
+    """
+    text = response.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        if text.rstrip().endswith("```"):
+            text = text.rstrip()[:-3]
+    try:
+        data = json.loads(text)
+    except (json.JSONDecodeError, ValueError):
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    return {str(key): value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+            for key, value in data.items() if value}
+
+
+class SummaryEngine:
+    """
+    统一的文件摘要引擎。
+
+    :param backend: 摘要后端
+    :param prompt_builder: 生成提示词的函数，签名同summarize.generate_prompt
+    :param template_id: 提示词模板ID，作为摘要缓存键的一部分
+    :param max_in_flight: 同时进行中的请求数上限
+    :param requests_per_minute: 每分钟请求数上限，None表示不限制
+    :param cache: utils.summary_cache.SummaryCache实例，None表示不使用缓存
+    :param print_log: 是否打印prompt和摘要
+    :param packed_prompt_builder: 生成多文件打包提示词的函数，参数为(文件路径, 文件内容)列表
+    :param packed_template_id: 打包提示词模板ID
+    :param pack_token_budget: 单个打包请求的token预算，None表示不打包
+    :param small_file_tokens: 估算token数不超过该值的文件才会被打包
+    :param splitter: 在方法边界切分源码的函数，参数为(文件内容, 每段最大字符数)
+    :param chunk_prompt_builder: 生成分段摘要提示词的函数，参数为(文件路径, 分段内容, 分段序号, 分段总数)
+    :param merge_prompt_builder: 生成合并摘要提示词的函数，参数为(文件路径, 各分段摘要列表)
+    :param chunk_template_id: 分段和合并提示词模板ID
+    :param large_file_tokens: 估算token数超过该值的文件走分段摘要再合并(map-reduce)，None表示不分段
+    :param chunk_tokens: 分段摘要时每段的token上限
+    """
+
+    def __init__(self, backend: SummaryBackend, prompt_builder: Callable, template_id: str, max_in_flight: int = 8,
+                 requests_per_minute: Optional[float] = None, cache=None, print_log: bool = False,
+                 packed_prompt_builder: Optional[Callable] = None, packed_template_id: Optional[str] = None,
+                 pack_token_budget: Optional[int] = None, small_file_tokens: int = 0,
+                 splitter: Optional[Callable] = None, chunk_prompt_builder: Optional[Callable] = None,
+                 merge_prompt_builder: Optional[Callable] = None, chunk_template_id: Optional[str] = None,
+                 large_file_tokens: Optional[int] = None, chunk_tokens: int = 0):
+        self.backend = backend
+        self.prompt_builder = prompt_builder
+        self.template_id = template_id
+        self.max_in_flight = max_in_flight
+        self.requests_per_minute = requests_per_minute
+        self.cache = cache
+        self.print_log = print_log
+        self.packed_prompt_builder = packed_prompt_builder
+        self.packed_template_id = packed_template_id
+        self.pack_token_budget = pack_token_budget if packed_prompt_builder is not None else None
+        self.small_file_tokens = small_file_tokens
+        self.splitter = splitter
+        self.chunk_prompt_builder = chunk_prompt_builder
+        self.merge_prompt_builder = merge_prompt_builder
+        self.chunk_template_id = chunk_template_id
+        self.large_file_tokens = large_file_tokens if splitter is not None else None
+        self.chunk_tokens = chunk_tokens
+        self._semaphore = None
+        self._request_semaphore = None
+        self._rate_limiter = None
+
+    def _init_limits(self):
+        # 信号量和限流器需要在事件循环内创建
+        # _semaphore限制同时处理的文件数，_request_semaphore限制同时进行中的请求数（大文件的分段请求也计入其中）
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        self._request_semaphore = asyncio.Semaphore(self.max_in_flight)
+        self._rate_limiter = RateLimiter(self.requests_per_minute) if self.requests_per_minute else None
+
+    async def _request(self, prompt: str) -> str:
+        async with self._request_semaphore:
+            if self._rate_limiter is not None:
+                await self._rate_limiter.acquire()
+            return await self.backend.complete(prompt)
+
+    def _lookup_cache(self, blob_hash: str) -> Optional[str]:
+        # 单文件摘要、打包摘要和分段合并摘要的结果可以互相复用
+        for template_id in (self.template_id, self.packed_template_id, self.chunk_template_id):
+            if template_id is None:
+                continue
+            summary = self.cache.get(blob_hash, template_id, self.backend.model_id)
+            if summary is not None:
+                return summary
+        return None
+
+    def _load(self, file_path, project_root, rel_path):
+        """
+        读取文件，返回(显示路径, 文件内容, blob哈希, 缓存的摘要)，读取失败时文件内容为None。
+        """
+        display_path = os.path.relpath(file_path, project_root) if rel_path else file_path
+        try:
+            with open(file_path, 'rb') as f:
+                raw = f.read()
+            content = raw.decode('utf-8')
+        except Exception as e:
+            print(f"读取文件 {file_path} 失败：{e}")
+            return display_path, None, None, None
+
+        blob_hash, summary = None, None
+        if self.cache is not None:
+            blob_hash = git_blob_hash(raw)
+            summary = self._lookup_cache(blob_hash)
+        return display_path, content, blob_hash, summary
+
+    async def summarize_file(self, file_path: str, project_root: Optional[str] = None,
+                             rel_path: bool = False) -> Tuple[str, Optional[str], Optional[str]]:
+        """
+        读取文件内容，生成摘要。
+        返回(文件路径，摘要，prompt)，rel_path为True时返回相对project_root的路径；缓存命中时prompt为None。
+        """
+        if self._semaphore is None:
+            self._init_limits()
+        # 读取文件也放在信号量内，保证同一时刻只有max_in_flight个文件的内容驻留在内存中
+        async with self._semaphore:
+            display_path, content, blob_hash, summary = self._load(file_path, project_root, rel_path)
+            if content is None or summary is not None:
+                return display_path, summary, None
+            return await self._summarize_content(file_path, display_path, content, blob_hash, project_root,
+                                                 rel_path)
+
+    async def _summarize_content(self, file_path, display_path, content, blob_hash, project_root, rel_path):
+        if self.large_file_tokens and estimate_tokens(content) > self.large_file_tokens:
+            return await self._summarize_large_content(file_path, display_path, content, blob_hash)
+
+        prompt = self.prompt_builder(file_path, content, rel_path, project_root)
+        if self.print_log:
+            print(f"prompt: \n{prompt}\n")
+
+        try:
+            summary = await self._request(prompt)
+        except Exception as e:
+            print(f"生成摘要失败：{file_path} {e}")
+            return display_path, None, prompt
+
+        if self.print_log:
+            print(f"summary：\n{summary}\n")
+        if self.cache is not None and summary:
+            self.cache.put(blob_hash, self.template_id, self.backend.model_id, summary)
+        return display_path, summary, prompt
+
+    async def _summarize_large_content(self, file_path, display_path, content, blob_hash):
+        """
+        超大文件的map-reduce摘要：在方法边界切分，并发总结各段，再把分段摘要合并成文件摘要。
+        """
+        chunks = self.splitter(content, self.chunk_tokens * BYTES_PER_TOKEN)
+        print(f"大文件分段摘要：{file_path} 切分为 {len(chunks)} 段")
+        chunk_prompts = [self.chunk_prompt_builder(display_path, chunk, index + 1, len(chunks))
+                         for index, chunk in enumerate(chunks)]
+        try:
+            chunk_summaries = await asyncio.gather(*(self._request(prompt) for prompt in chunk_prompts))
+            prompt = self.merge_prompt_builder(display_path, chunk_summaries)
+            if self.print_log:
+                print(f"prompt: \n{prompt}\n")
+            summary = await self._request(prompt)
+        except Exception as e:
+            print(f"生成摘要失败：{file_path} {e}")
+            return display_path, None, None
+
+        if self.print_log:
+            print(f"summary：\n{summary}\n")
+        if self.cache is not None and summary:
+            self.cache.put(blob_hash, self.chunk_template_id, self.backend.model_id, summary)
+        return display_path, summary, prompt
+
+    async def summarize_pack(self, file_paths: List[str], project_root: Optional[str] = None,
+                             rel_path: bool = False) -> List[Tuple[str, Optional[str], Optional[str]]]:
+        """
+        把多个小文件放进同一个请求生成摘要，模型返回的JSON按文件拆分回各自的结果。
+        模型输出无法解析或缺少某个文件时，该文件退回单文件摘要。
+        """
+        if self._semaphore is None:
+            self._init_limits()
+        async with self._semaphore:
+            results, pending = [], []
+            for file_path in file_paths:
+                display_path, content, blob_hash, summary = self._load(file_path, project_root, rel_path)
+                if content is None or summary is not None:
+                    results.append((display_path, summary, None))
+                else:
+                    pending.append((file_path, display_path, content, blob_hash))
+
+            if len(pending) == 1:
+                results.append(await self._summarize_content(*pending[0], project_root, rel_path))
+                return results
+            if not pending:
+                return results
+
+            prompt = self.packed_prompt_builder([(display_path, content) for _, display_path, content, _ in pending])
+            if self.print_log:
+                print(f"prompt: \n{prompt}\n")
+            try:
+                response = await self._request(prompt)
+            except Exception as e:
+                print(f"生成打包摘要失败：{', '.join(file for file, _, _, _ in pending)} {e}")
+                return results + [(display_path, None, prompt) for _, display_path, _, _ in pending]
+            if self.print_log:
+                print(f"summary：\n{response}\n")
+
+            summaries = parse_packed_response(response)
+            for file_path, display_path, content, blob_hash in pending:
+                summary = summaries.get(display_path)
+                if not summary:
+                    results.append(await self._summarize_content(file_path, display_path, content, blob_hash,
+                                                                 project_root, rel_path))
+                    continue
+                if self.cache is not None:
+                    self.cache.put(blob_hash, self.packed_template_id, self.backend.model_id, summary)
+                results.append((display_path, summary, prompt))
+            return results
+
+    def plan_packs(self, file_paths: List[str]) -> Tuple[List[str], List[List[str]]]:
+        """
+        将文件划分为单独摘要的文件和打包摘要的文件组。
+        按路径排序后贪心装箱，同一个包里的文件尽量来自同一个目录。
+        """
+        if not self.pack_token_budget:
+            return list(file_paths), []
+
+        singles, packs, current, current_tokens = [], [], [], 0
+        for file_path in sorted(file_paths):
+            try:
+                tokens = estimate_file_tokens(file_path)
+            except OSError:
+                singles.append(file_path)
+                continue
+            if tokens > self.small_file_tokens:
+                singles.append(file_path)
+                continue
+            if current and current_tokens + tokens > self.pack_token_budget:
+                packs.append(current)
+                current, current_tokens = [], 0
+            current.append(file_path)
+            current_tokens += tokens
+        if current:
+            packs.append(current)
+
+        singles.extend(pack[0] for pack in packs if len(pack) == 1)
+        return singles, [pack for pack in packs if len(pack) > 1]
+
+    async def summarize_files(self, file_paths: List[str], project_root: Optional[str] = None,
+                              rel_path: bool = False) -> List[Tuple[str, Optional[str], Optional[str]]]:
+        """
+        并发生成摘要，返回按文件路径排序的三元组列表(文件路径，摘要，prompt)。
+        """
+        self._init_limits()
+        singles, packs = self.plan_packs(file_paths)
+        single_results, pack_results = await asyncio.gather(
+            asyncio.gather(*(self.summarize_file(file, project_root, rel_path) for file in singles)),
+            asyncio.gather(*(self.summarize_pack(pack, project_root, rel_path) for pack in packs)),
+        )
+        results = list(single_results)
+        for pack_result in pack_results:
+            results.extend(pack_result)
+        return sorted(results, key=lambda x: x[0])
+
+    async def summarize_files_to_sink(self, file_paths: List[str], sink: Callable[[str, str], None],
+                                      project_root: Optional[str] = None, rel_path: bool = False) -> int:
+        """
+        并发生成摘要，每完成一个文件就调用sink(文件路径, 摘要)，结果不在内存中累积。
+        生成失败的文件不会写入sink。返回写入的摘要数量。
+        """
+        self._init_limits()
+        singles, packs = self.plan_packs(file_paths)
+        tasks = [asyncio.ensure_future(self.summarize_file(file, project_root, rel_path)) for file in singles]
+        tasks += [asyncio.ensure_future(self.summarize_pack(pack, project_root, rel_path)) for pack in packs]
+
+        count = 0
+        for future in asyncio.as_completed(tasks):
+            result = await future
+            for path, summary, _ in (result if isinstance(result, list) else [result]):
+                if summary:
+                    sink(path, summary)
+                    count += 1
+        return count
@@ -0,0 +1,96 @@
+import os
+import pathlib
+import sqlite3
+import threading
+from typing import Iterator, Set, Tuple
+
+
+class SummaryStore:
+    """
+    基于SQLite的摘要存储，每条摘要生成后立即落盘。
+
+    进程中断后重新打开同一个文件，done_paths()会返回已经完成的文件，重新运行时可以跳过它们。
+    """
+
+    def __init__(self, db_path: str):
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS summaries (
+                path TEXT PRIMARY KEY,
+                summary TEXT NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def add(self, path: str, summary: str) -> None:
+        """
+        写入一条摘要并立即提交，同一路径的旧摘要会被覆盖。
+        """
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO summaries (path, summary) VALUES (?, ?)", (path, summary))
+            self._conn.commit()
+
+    def add_many(self, items) -> None:
+        """
+        在一个事务中批量写入(路径, 摘要)。
+        """
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO summaries (path, summary) VALUES (?, ?)", items)
+            self._conn.commit()
+
+    def remove(self, path: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM summaries WHERE path = ?", (path,))
+            self._conn.commit()
+
+    def done_paths(self) -> Set[str]:
+        """
+        返回已经完成摘要的文件路径集合。
+        """
+        with self._lock:
+            return {row[0] for row in self._conn.execute("SELECT path FROM summaries")}
+
+    def items(self) -> Iterator[Tuple[str, str]]:
+        """
+        按路径顺序逐条返回(路径, 摘要)，不会一次性把所有摘要读入内存。
+        """
+        cursor = sqlite3.connect(self.db_path).execute("SELECT path, summary FROM summaries ORDER BY path")
+        try:
+            yield from cursor
+        finally:
+            cursor.connection.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def connect_read_only(db_path: str) -> sqlite3.Connection:
+    """
+    以只读方式打开SQLite文件，不会创建文件、修改日志模式或写入数据。
+    """
+    uri = pathlib.Path(db_path).resolve().as_uri()
+    return sqlite3.connect(f"{uri}?mode=ro", uri=True, check_same_thread=False)
+
+
+def read_summaries(db_path: str) -> Iterator[Tuple[str, str]]:
+    """
+    只读打开已完成的摘要库，按路径顺序逐条返回(路径, 摘要)，读完后关闭连接。
+    """
+    conn = connect_read_only(db_path)
+    try:
+        yield from conn.execute("SELECT path, summary FROM summaries ORDER BY path")
+    finally:
+        conn.close()
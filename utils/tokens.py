@@ -0,0 +1,20 @@
+"""
+不依赖分词器的token数估算，供摘要打包和代码库拼接的预算使用。
+"""
+import os
+
+# 按字节数粗略估算token数，Java源码以ASCII为主，约3个字节对应一个token
+BYTES_PER_TOKEN = 3
+# 全文定位时拼接代码库的默认token预算，为提示词模板和模型输出留出余量（按128k上下文估计）
+FULL_TEXT_TOKEN_BUDGET = 100000
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text.encode("utf-8")) // BYTES_PER_TOKEN
+
+
+def estimate_file_tokens(file_path: str) -> int:
+    """
+    根据文件大小估算token数，不需要读取文件内容。
+    """
+    return os.path.getsize(file_path) // BYTES_PER_TOKEN + 1